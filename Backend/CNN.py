@@ -1,69 +1,251 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import tensorflow as tf
+try:
+    from flask_sock import Sock
+except ImportError:  # El endpoint /stream es opcional
+    Sock = None
 import numpy as np
 import cv2
-import pandas as pd
 import os
+import json
 import uuid
-import mediapipe as mp
 import threading
 import math
+import hmac
 import time
 from functools import wraps
-from custom_layers.layers import (
-    DrowsinessIndexLayer,
-    AttentionConsecutiveAdjustment,
-    EyesClosedConsecutiveAdjustment,
-    YawningConsecutiveAdjustment,
-    CombinedConsecutiveAdjustment,
-    ExtremeValueAdjustment
-)
-from custom_layers.constraints import MinMaxValueConstraint
-from sklearn.preprocessing import LabelEncoder
-from tensorflow.keras.preprocessing.sequence import pad_sequences
+from preprocessing import (detect_face, crop_and_normalize, normalize_gray, parse_raw_roi,
+                           parse_relative_box, zoom_relative_box)
+from admission import FrameAdmission, FrameDropped
+from pipeline import StagedPipeline
+from metrics import MetricsRegistry
+from face_tracker import FaceBoxTracker, TrackerMetrics
+from roi_cache import CacheMetrics, RoiPredictionCache
+from inference import BatchingScheduler, CompiledModel, TFLiteModel
+from model_registry import CnnModelRegistry, list_models
+from drowsiness_engine import DrowsinessParams, IndexCache, NumpyDrowsinessModel, StreamingDrowsinessEvaluator
+from gesture_log import GestureLogWriter
+from gesture_store import GestureRingBuffer, SessionStore, SessionSweeper, SnapshotExporter, load_snapshot, session_file
 
 app = Flask(__name__)
 CORS(app)
 
-# ================= FUNCIONES AUXILIARES =================
-def crear_encoder_gestos():
-    """Crea y ajusta el encoder de gestos igual que durante el entrenamiento"""
-    encoder = LabelEncoder()
-    encoder.fit(GESTOS_VALIDOS)
-    return encoder
-
 # ================= CONFIGURACIÓN =================
 EXCEL_FILE = "gesture_sequence.xlsx"
+# Exportación opcional de la secuencia fuera del camino crítico: "" (desactivada), "xlsx" o "csv"
+EXPORT_FORMAT = os.environ.get("VIGIL_GESTURE_EXPORT", "").lower()
+EXPORT_FILE = EXCEL_FILE if EXPORT_FORMAT != "csv" else os.path.splitext(EXCEL_FILE)[0] + ".csv"
+EXPORT_INTERVAL = float(os.environ.get("VIGIL_EXPORT_INTERVAL", "1.0"))
+# Diario binario de solo-añadido con todos los gestos de cada sesión: carpeta ("" = desactivado)
+GESTURE_LOG_DIR = os.environ.get("VIGIL_GESTURE_LOG_DIR", "")
+GESTURE_LOG_FLUSH_INTERVAL = float(os.environ.get("VIGIL_GESTURE_LOG_FLUSH_INTERVAL", "0.5"))
+# Sesiones por token: se expulsan tras SESSION_TTL segundos sin actividad o por LRU
+SESSION_TTL = float(os.environ.get("VIGIL_SESSION_TTL", "900"))
+MAX_SESSIONS = int(os.environ.get("VIGIL_MAX_SESSIONS", "10000"))
+# Cada cuántos segundos se recorren todas las sesiones para expulsar las caducadas
+SESSION_SWEEP_INTERVAL = float(os.environ.get("VIGIL_SESSION_SWEEP_INTERVAL", "60"))
+SESSION_SHARDS = 16
+# Detectores MediaPipe reutilizados entre peticiones (uno por hilo de trabajo concurrente)
+DETECTOR_POOL_SIZE = int(os.environ.get("VIGIL_DETECTOR_POOL", "4"))
+# Micro-batching de la CNN: tamaño máximo de lote y espera máxima (ms) antes de enviarlo
+CNN_MAX_BATCH = int(os.environ.get("VIGIL_CNN_MAX_BATCH", "16"))
+CNN_MAX_WAIT_MS = float(os.environ.get("VIGIL_CNN_MAX_WAIT_MS", "5"))
+# Re-detección del rostro cada N frames por sesión (1 = detectar siempre)
+REDETECT_INTERVAL = int(os.environ.get("VIGIL_REDETECT_INTERVAL", "5"))
+# Diferencia media máxima (niveles de gris) para reutilizar la caja anterior
+TRACKER_MAX_DIFF = float(os.environ.get("VIGIL_TRACKER_MAX_DIFF", "20"))
+TRACKER_MIN_CONFIDENCE = float(os.environ.get("VIGIL_TRACKER_MIN_CONFIDENCE", "0.7"))
+# Cada cuántas cajas reutilizadas se compara la predicción con una detección completa (0 = nunca)
+TRACKER_AUDIT_EVERY = int(os.environ.get("VIGIL_TRACKER_AUDIT_EVERY", "50"))
+# Ventanas distintas cuyo índice se guarda en la caché LRU compartida entre sesiones (0 = desactivada)
+INDEX_CACHE_SIZE = int(os.environ.get("VIGIL_INDEX_CACHE_SIZE", "4096"))
+# Reutilizar la predicción de la CNN si la ROI casi no cambió (diferencia máxima por celda, 0 = desactivado)
+ROI_CACHE_DISTANCE = float(os.environ.get("VIGIL_ROI_CACHE_DISTANCE", "0.03"))
+# Segundos que una predicción reutilizada sigue siendo válida
+ROI_CACHE_MAX_AGE = float(os.environ.get("VIGIL_ROI_CACHE_MAX_AGE", "2.0"))
+# Un frame en proceso por sesión; uno más puede esperar como mucho este tiempo antes de descartarse
+MAX_FRAME_WAIT_MS = float(os.environ.get("VIGIL_MAX_FRAME_WAIT_MS", "1000"))
+# Segundos que una petición espera su frame en el pipeline antes de abandonarlo con error
+FRAME_TIMEOUT = float(os.environ.get("VIGIL_FRAME_TIMEOUT", "30"))
+# Concurrencia de cada etapa del pipeline: decodificación/preprocesamiento y secuencia/índice
+PREPROCESS_WORKERS = int(os.environ.get("VIGIL_PREPROCESS_WORKERS", str(DETECTOR_POOL_SIZE)))
+POSTPROCESS_WORKERS = int(os.environ.get("VIGIL_POSTPROCESS_WORKERS", "2"))
+# Frames que pueden estar dentro del pipeline a la vez; al llenarse, las peticiones esperan
+PIPELINE_MAX_PENDING = int(os.environ.get("VIGIL_PIPELINE_MAX_PENDING", "64"))
+# Compilar los modelos con XLA además de tf.function (si alguna operación no es compatible se desactiva)
+USE_XLA = os.environ.get("VIGIL_XLA", "0") == "1"
+# Motor de la CNN: "keras" (grafo compilado) o "tflite" (modelo cuantizado generado con quantize.py)
+CNN_BACKEND = os.environ.get("VIGIL_CNN_BACKEND", "keras").lower()
+TFLITE_MODEL_PATH = os.environ.get("VIGIL_TFLITE_MODEL", "./models/2105_dynamic.tflite")
+TFLITE_THREADS = int(os.environ.get("VIGIL_TFLITE_THREADS", str(os.cpu_count() or 1)))
+# Cálculo del índice: "streaming" (incremental, O(1) por gesto), "numpy" (ventana completa
+# en NumPy) o "keras" (lstm_model compilado)
+INDEX_BACKEND = os.environ.get("VIGIL_INDEX_BACKEND", "streaming").lower()
 MAX_RECORDS = 240
 class_names = ["Attention", "EyesClosed", "Yawning"]
-mp_face_detection = mp.solutions.face_detection
 GESTOS_VALIDOS = ['Attention', 'Yawning', 'EyesClosed']
+# Códigos de gesto del entrenamiento: el LabelEncoder los ordenaba alfabéticamente
+GESTURE_CODES = {'Attention': 0, 'EyesClosed': 1, 'Yawning': 2}
 MAX_LEN = 240
-gesture_encoder = crear_encoder_gestos()  # Usando tu función existente
-excel_lock = threading.Lock()
+snapshot_exporter = None
+gesture_log = None
+session_sweeper = None
 MAX_RETRIES = 3
 RETRY_DELAY = 0.1
 
-# Configuración de modelos personalizados
-custom_objects = {
-    'MinMaxValueConstraint': MinMaxValueConstraint,
-    'DrowsinessIndexLayer': DrowsinessIndexLayer,
-    'AttentionConsecutiveAdjustment': AttentionConsecutiveAdjustment,
-    'EyesClosedConsecutiveAdjustment': EyesClosedConsecutiveAdjustment,
-    'YawningConsecutiveAdjustment': YawningConsecutiveAdjustment,
-    'CombinedConsecutiveAdjustment': CombinedConsecutiveAdjustment,
-    'ExtremeValueAdjustment': ExtremeValueAdjustment
-}
+# Métricas del proceso, expuestas en /metrics
+metrics = MetricsRegistry()
+STAGES = ["decode", "detect", "preprocess", "cnn", "sequence_update", "index"]
+stage_seconds = {stage: metrics.histogram("stage_seconds", "Latencia de cada etapa del procesamiento de un frame", stage=stage)
+                 for stage in STAGES}
+frame_seconds = metrics.histogram("frame_seconds", "Latencia total de un frame dentro del servidor")
+cnn_batch_size = metrics.histogram("cnn_batch_size", "ROIs por llamada a la CNN", buckets=(1, 2, 4, 8, 16, 32, 64))
+no_face_frames = metrics.counter("no_face_frames_total", "Frames sin rostro detectado")
+store_retries = metrics.counter("store_retries_total", "Reintentos de acceso al almacén de gestos")
+store_failures = metrics.counter("store_failures_total", "Accesos al almacén de gestos que agotaron los reintentos")
+gesture_counts = {name: metrics.counter("gestures_total", "Gestos clasificados", gesture=name) for name in class_names}
+
+errors = {stage: metrics.counter("errors_total", "Errores por etapa", stage=stage)
+          for stage in ("preprocess", "index", "request", "stream")}
+
+def count_error(stage):
+    errors[stage].inc()
 
 # Carga de modelos
-lstm_model = tf.keras.models.load_model(
-    "./models/Modelo_6_capas.h5",
-    custom_objects=custom_objects,
-    compile=False
+# Carpeta con los modelos que se pueden activar en caliente (GET /models los lista)
+MODELS_DIR = os.environ.get("VIGIL_MODELS_DIR", "./models")
+CNN_MODEL_PATH = os.environ.get("VIGIL_CNN_MODEL", TFLITE_MODEL_PATH if CNN_BACKEND == "tflite" else "./models/2105.h5")
+LSTM_MODEL_PATH = os.environ.get("VIGIL_INDEX_MODEL", "./models/Modelo_6_capas.h5")
+# Token para los endpoints que cambian de modelo ("" = cambios deshabilitados)
+ADMIN_TOKEN = os.environ.get("VIGIL_ADMIN_TOKEN", "")
+# Pesos y configuración de las capas del índice, leídos del .h5 para los motores sin TensorFlow
+drowsiness_params = DrowsinessParams.from_h5(LSTM_MODEL_PATH)
+numpy_index_model = NumpyDrowsinessModel(drowsiness_params, window=MAX_LEN)
+index_model_path = LSTM_MODEL_PATH
+
+lstm_model = None
+lstm_runner = None
+cnn_registry = None
+face_detector_pool = None
+model_swap_lock = threading.Lock()
+
+def load_cnn(path):
+    """Carga y calienta una CNN: .tflite con el intérprete de TFLite, si no Keras compilado"""
+    # Grafos compilados una vez con firma fija y calentados al arrancar, en lugar de Model.predict
+    if path.endswith(".tflite"):
+        runner = TFLiteModel(path, num_threads=TFLITE_THREADS)
+    else:
+        import tensorflow as tf
+        runner = CompiledModel(tf.keras.models.load_model(path), (None, 112, 112, 1),
+                               jit_compile=USE_XLA, warmup=False)
+    runner.warmup(batch_sizes=(1, CNN_MAX_BATCH))
+    return runner
+
+def load_index_model(path):
+    """Carga un modelo del índice: (parámetros, motor NumPy, modelo Keras, modelo compilado)"""
+    params = DrowsinessParams.from_h5(path)
+    numpy_model = NumpyDrowsinessModel(params, window=MAX_LEN)
+    numpy_model.index(np.zeros(MAX_LEN, dtype=np.uint8))
+    keras_model = runner = None
+    if INDEX_BACKEND == "keras":
+        import tensorflow as tf
+        from custom_layers import CUSTOM_OBJECTS
+        keras_model = tf.keras.models.load_model(path, custom_objects=CUSTOM_OBJECTS, compile=False)
+        runner = CompiledModel(keras_model, (None, MAX_LEN, 1), jit_compile=USE_XLA)
+    return params, numpy_model, keras_model, runner
+
+def activate_index_model(path):
+    """Cambia en caliente el modelo del índice sin perder las ventanas de las sesiones.
+
+    Las sesiones adoptan los parámetros nuevos en su siguiente índice (get_drowsiness_index)
+    y la caché del índice se reemplaza, porque sus valores dependen del modelo.
+    """
+    global drowsiness_params, numpy_index_model, lstm_model, lstm_runner, index_cache, index_model_path
+    loaded = load_index_model(path)
+    with model_swap_lock:
+        drowsiness_params, numpy_index_model, lstm_model, lstm_runner = loaded
+        index_model_path = path
+        # Después de los modelos: quien lea la caché nueva ya ve los parámetros nuevos
+        index_cache = IndexCache(INDEX_CACHE_SIZE) if INDEX_CACHE_SIZE > 0 else None
+    print(f"✅ Modelo del índice {os.path.basename(path)} activo")
+
+def load_models():
+    """Carga y calienta los modelos de TensorFlow y los detectores de rostro del proceso actual.
+
+    TensorFlow, MediaPipe y las capas personalizadas se importan aquí y no al importar el
+    módulo. El runtime de TensorFlow se bloquea si se bifurca después de ejecutar un grafo,
+    así que serve.py importa este módulo con VIGIL_DEFER_MODELS=1 y la carga ocurre en cada worker.
+    """
+    global lstm_model, lstm_runner, cnn_registry, face_detector_pool, session_sweeper
+    from face_detection_pool import FaceDetectorPool
+
+    # Expulsión periódica de sesiones inactivas en el proceso que atiende (cualquier punto de entrada)
+    if session_sweeper is None:
+        session_sweeper = SessionSweeper((gesture_sessions, face_trackers, roi_caches), interval=SESSION_SWEEP_INTERVAL)
+
+    cnn_registry = CnnModelRegistry(load_cnn, num_classes=len(class_names))
+    cnn_registry.activate(CNN_MODEL_PATH)
+    if INDEX_BACKEND == "keras":
+        _, _, lstm_model, lstm_runner = load_index_model(LSTM_MODEL_PATH)
+
+    # Pool de detectores de rostro, calentado antes de recibir peticiones
+    face_detector_pool = FaceDetectorPool(
+        size=DETECTOR_POOL_SIZE, model_selection=0, min_detection_confidence=0.5
+    )
+    face_detector_pool.warmup()
+
+def run_cnn(inputs):
+    start = time.perf_counter()
+    outputs = cnn_registry.predict(inputs)
+    stage_seconds["cnn"].observe(time.perf_counter() - start)
+    cnn_batch_size.observe(len(inputs))
+    return outputs
+
+# Las ROIs de peticiones concurrentes se agrupan en una sola llamada al modelo
+cnn_scheduler = BatchingScheduler(
+    run_cnn,
+    max_batch_size=CNN_MAX_BATCH,
+    max_wait_ms=CNN_MAX_WAIT_MS
 )
 
-cnn_model = tf.keras.models.load_model("./models/2105.h5")
+# ================= ARRANQUE =================
+# Instantes (perf_counter) del arranque; serve.py reinicia process_started en cada worker
+startup = {"process_started": time.perf_counter(), "load_started": None, "ready": None,
+           "first_prediction": None, "error": None}
+models_ready = threading.Event()
+
+def start_background_load():
+    """Carga y calienta los modelos en un hilo; mientras tanto /readyz responde 503"""
+    def run():
+        startup["load_started"] = time.perf_counter()
+        try:
+            load_models()
+        except Exception as e:
+            startup["error"] = str(e)
+            print(f"❌ Error cargando los modelos: {e}")
+            return
+        startup["ready"] = time.perf_counter()
+        models_ready.set()
+        print(f"✅ Modelos listos en {startup['ready'] - startup['process_started']:.1f} s desde el arranque "
+              f"(carga y calentamiento: {startup['ready'] - startup['load_started']:.1f} s)")
+
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+def wait_until_ready(timeout=None):
+    """Bloquea hasta que los modelos estén cargados (para scripts que importan este módulo)"""
+    if not models_ready.wait(timeout):
+        raise TimeoutError(startup["error"] or "Los modelos no terminaron de cargar a tiempo")
+
+def startup_seconds():
+    """Segundos desde el arranque del proceso hasta cada hito alcanzado"""
+    origin = startup["process_started"]
+    return {name: startup[name] - origin for name in ("load_started", "ready", "first_prediction")
+            if startup[name] is not None}
+
+if os.environ.get("VIGIL_DEFER_MODELS") != "1":
+    start_background_load()
 
 def synchronized_excel_access(func):
     @wraps(func)
@@ -71,259 +253,568 @@ def synchronized_excel_access(func):
         last_exception = None
         for attempt in range(MAX_RETRIES):
             try:
-                with excel_lock:
-                    result = func(*args, **kwargs)
-                return result
+                return func(*args, **kwargs)
             except Exception as e:
                 last_exception = e
+                store_retries.inc()
                 time.sleep(RETRY_DELAY)
-        print(f"Failed to access Excel file after {MAX_RETRIES} attempts: {last_exception}")
+        store_failures.inc()
+        print(f"Failed to access gesture store after {MAX_RETRIES} attempts: {last_exception}")
         # Return safe default values depending on the function
         if func.__name__ == "get_drowsiness_index":
             return 0.0
-        elif func.__name__ == "update_gesture_sequence":
-            return pd.DataFrame({'Step': range(1, MAX_RECORDS + 1), 'Gesture': ['Attention'] * MAX_RECORDS})
         else:
             raise last_exception
     return wrapper
 
 # ================= FUNCIONES MEJORADAS =================
-@synchronized_excel_access
+def crear_secuencia_sesion(token):
+    """Crea el buffer de una sesión nueva, restaurando su última instantánea si existe"""
+    evaluator = None
+    if INDEX_BACKEND == "streaming":
+        evaluator = StreamingDrowsinessEvaluator(drowsiness_params, window=MAX_LEN)
+    buffer = GestureRingBuffer(MAX_RECORDS, classes=list(GESTURE_CODES), evaluator=evaluator)
+    if EXPORT_FORMAT:
+        path = session_file(EXPORT_FILE, token)
+        if os.path.exists(path):
+            try:
+                buffer.load(load_snapshot(path))
+            except Exception as e:
+                # Si hay algún error con el archivo existente, se sobrescribe en la próxima exportación
+                print(f"⚠️ No se pudo restaurar {path}: {e}")
+    return buffer
+
+gesture_sessions = SessionStore(
+    crear_secuencia_sesion,
+    num_shards=SESSION_SHARDS,
+    ttl=SESSION_TTL,
+    max_sessions=MAX_SESSIONS
+)
+
+frame_admission = FrameAdmission(max_wait=MAX_FRAME_WAIT_MS / 1000.0)
+
+tracker_metrics = TrackerMetrics(audit_every=TRACKER_AUDIT_EVERY)
+face_trackers = SessionStore(
+    lambda token: FaceBoxTracker(REDETECT_INTERVAL, TRACKER_MAX_DIFF, TRACKER_MIN_CONFIDENCE, tracker_metrics),
+    num_shards=SESSION_SHARDS,
+    ttl=SESSION_TTL,
+    max_sessions=MAX_SESSIONS
+)
+
+roi_cache_metrics = CacheMetrics()
+roi_caches = SessionStore(
+    lambda token: RoiPredictionCache(ROI_CACHE_DISTANCE, ROI_CACHE_MAX_AGE, roi_cache_metrics),
+    num_shards=SESSION_SHARDS,
+    ttl=SESSION_TTL,
+    max_sessions=MAX_SESSIONS
+)
+
 def initialize_excel():
-    """Inicializa el archivo Excel con 240 registros de 'Attention'"""
-    if not os.path.exists(EXCEL_FILE):
-        df = pd.DataFrame({
-            'Step': range(1, MAX_RECORDS + 1),
-            'Gesture': ['Attention'] * MAX_RECORDS
-        })
-        df.to_excel(EXCEL_FILE, index=False)
-    else:
-        # Verificar que el archivo existente tenga el formato correcto
-        try:
-            df = pd.read_excel(EXCEL_FILE)
-            if len(df) < MAX_RECORDS:
-                missing = MAX_RECORDS - len(df)
-                new_rows = pd.DataFrame({
-                    'Step': range(len(df) + 1, len(df) + missing + 1),
-                    'Gesture': ['Attention'] * missing
-                })
-                df = pd.concat([df, new_rows], ignore_index=True)
-                df.to_excel(EXCEL_FILE, index=False)
-        except:
-            # Si hay algún error con el archivo existente, lo recreamos
-            df = pd.DataFrame({
-                'Step': range(1, MAX_RECORDS + 1),
-                'Gesture': ['Attention'] * MAX_RECORDS
-            })
-            df.to_excel(EXCEL_FILE, index=False)
+    """Arranca la exportación de instantáneas y el diario de gestos en segundo plano si están habilitados"""
+    global snapshot_exporter, gesture_log
+    if EXPORT_FORMAT:
+        snapshot_exporter = SnapshotExporter(fmt=EXPORT_FORMAT, interval=EXPORT_INTERVAL)
+    if GESTURE_LOG_DIR:
+        gesture_log = GestureLogWriter(GESTURE_LOG_DIR, flush_interval=GESTURE_LOG_FLUSH_INTERVAL)
 
-@synchronized_excel_access
-def update_gesture_sequence(new_gesture):
-    """Actualiza la secuencia de gestos con el nuevo gesto"""
-    # Validar el gesto
-    valid_gestures = ['Attention', 'Yawning', 'EyesClosed']
-    gesture = new_gesture if new_gesture in valid_gestures else 'Attention'
-    
-    try:
-        df = pd.read_excel(EXCEL_FILE)
-    except:
-        initialize_excel()
-        df = pd.read_excel(EXCEL_FILE)
-    
-    # Verificar integridad del DataFrame
-    if 'Step' not in df.columns or 'Gesture' not in df.columns:
-        initialize_excel()
-        df = pd.read_excel(EXCEL_FILE)
-    
-    # Verificar si hay menos de 240 registros y completar con 'Attention'
-    if len(df) < MAX_RECORDS:
-        missing = MAX_RECORDS - len(df)
-        new_rows = pd.DataFrame({
-            'Step': range(len(df) + 1, len(df) + missing + 1),
-            'Gesture': ['Attention'] * missing
-        })
-        df = pd.concat([df, new_rows], ignore_index=True)
-    
-    # Asegurar que tenemos exactamente MAX_RECORDS registros
-    df = df.tail(MAX_RECORDS).copy()
-    df['Step'] = range(1, MAX_RECORDS + 1)  # Reindexar pasos
-    
-    # Desplazar todos los gestos hacia arriba (Step 240 → 239, 239 → 238, etc.)
-    df['Gesture'] = df['Gesture'].shift(-1)
-    df.loc[df['Step'] == MAX_RECORDS, 'Gesture'] = gesture
-    
-    # Guardar el archivo actualizado
-    df.to_excel(EXCEL_FILE, index=False)
-    
-    return df
+def update_gesture_sequence(new_gesture, token=None, gesture_store=None):
+    """Actualiza la secuencia de gestos de la sesión con el nuevo gesto.
+
+    Sin reintentos: repetir la llamada tras un error volvería a añadir el gesto a la
+    ventana y al diario. La exportación ocurre en segundo plano y no falla aquí.
+    `gesture_store` evita buscar la sesión cuando el llamador ya la tiene (/stream).
+    """
+    if gesture_store is None:
+        gesture_store = gesture_sessions.get(token)
+    # Los gestos no válidos se registran como 'Attention'
+    gesture_store.append(new_gesture)
+    if gesture_log is not None:
+        gesture_log.append(token, gesture_store.encode(new_gesture))
+
+    if snapshot_exporter is not None:
+        gestures = gesture_store.gestures()
+        snapshot_exporter.submit(session_file(EXPORT_FILE, token), gestures)
+        return gestures
+    return None
+
+def compute_window_index(secuencia_codificada):
+    """Índice (0-1) de una ventana codificada con el backend numpy o keras"""
+    if INDEX_BACKEND == "numpy":
+        return numpy_index_model.index(secuencia_codificada)
+
+    # El buffer ya guarda la ventana codificada igual que GESTURE_CODES y con
+    # longitud fija MAX_LEN, por lo que no hace falta transform() ni pad_sequences()
+    # Conversión a float32 para compatibilidad con el modelo
+    X = secuencia_codificada.reshape((1, MAX_LEN, 1)).astype(np.float32)
+
+    # Predicción (manteniendo el formato de salida original)
+    extreme_adjusted_index, _ = lstm_runner(X)
+    return float(extreme_adjusted_index[0][0])
+
+index_cache = IndexCache(INDEX_CACHE_SIZE) if INDEX_CACHE_SIZE > 0 else None
 
 @synchronized_excel_access
-def get_drowsiness_index():
-    """Calcula el índice de somnolencia replicando exactamente el preprocesamiento del entrenamiento"""
+def get_drowsiness_index(token=None, gesture_store=None):
+    """Calcula el índice de somnolencia de la sesión replicando exactamente el preprocesamiento del entrenamiento"""
     try:
-        # 1. Leer y procesar el archivo (igual que procesar_archivo())
-        df = pd.read_excel(EXCEL_FILE)
-        
-        # Validación de estructura
-        if 'Gesture' not in df.columns:
-            print("❌ Error: Archivo no contiene columna 'Gesture'")
-            return 0.0
-            
-        # Limpieza idéntica al entrenamiento
-        df = df.dropna(subset=['Gesture'])
-        df = df[df['Gesture'].isin(GESTOS_VALIDOS)]
-        
-        if len(df) == 0:
-            print("⚠️ Advertencia: Archivo vacío después de limpieza, usando secuencia por defecto")
-            secuencia_gestos = ['Attention'] * MAX_LEN
+        if gesture_store is None:
+            gesture_store = gesture_sessions.get(token)
+        # La caché se lee antes que los parámetros (ver activate_index_model)
+        cache = index_cache
+
+        if gesture_store.evaluator is not None:
+            # Tras un cambio de modelo del índice la sesión adopta los parámetros nuevos
+            params = drowsiness_params
+            if gesture_store.evaluator.params is not params:
+                gesture_store.set_evaluator_params(params)
+            # Las estadísticas de la ventana se actualizan en cada gesto: no hay que
+            # recorrer los 240 pasos ni llamar al modelo
+            confidence = gesture_store.drowsiness_index(cache) * 100
+        elif cache is not None:
+            confidence = cache.get_or_compute(gesture_store.window(), compute_window_index) * 100
         else:
-            secuencia_gestos = df['Gesture'].tail(MAX_LEN).tolist()
-            # Si no hay suficientes gestos, completamos con 'Attention' al inicio
-            if len(secuencia_gestos) < MAX_LEN:
-                secuencia_gestos = ['Attention'] * (MAX_LEN - len(secuencia_gestos)) + secuencia_gestos
-        
-        # 2. Codificación idéntica al entrenamiento
-        secuencia_codificada = gesture_encoder.transform(secuencia_gestos)
-        
-        # 3. Padding y reshape (igual que preparar_datos())
-        secuencia_padded = pad_sequences(
-            [secuencia_codificada],
-            maxlen=MAX_LEN,
-            padding='post',
-            truncating='post'
-        )
-        
-        # Conversión a float32 para compatibilidad con el modelo
-        X = secuencia_padded.reshape((1, MAX_LEN, 1)).astype(np.float32)
-        
-        # 4. Predicción (manteniendo el formato de salida original)
-        extreme_adjusted_index, _ = lstm_model.predict(X, verbose=0)
-        confidence = float(extreme_adjusted_index[0][0]) * 100
-        
+            confidence = compute_window_index(gesture_store.window()) * 100
+
         # Aseguramos que el resultado esté en el rango correcto
         return min(max(round(confidence), 0), 100)
-    
+
     except Exception as e:
+        count_error("index")
         print(f"❌ Error crítico en get_drowsiness_index(): {str(e)}")
         return 0.0
 
-def preprocess_image(frame, target_size=(112, 112)):
+def detect_with_pool(frame):
+    """Detección completa con un detector del pool: (caja, score)"""
+    with face_detector_pool.acquire() as face_detection:
+        return detect_face(frame, face_detection)
+
+def preprocess_image(frame, target_size=(112, 112), token=None):
     """Preprocesa la imagen para el modelo CNN"""
     try:
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        with mp_face_detection.FaceDetection(
-            model_selection=0, min_detection_confidence=0.5
-        ) as face_detection:
-            results = face_detection.process(rgb)
-            if results.detections:
-                detection = results.detections[0]
-                bboxC = detection.location_data.relative_bounding_box
-                ih, iw, _ = frame.shape
-                x1 = int(bboxC.xmin * iw)
-                y1 = int(bboxC.ymin * ih)
-                w = int(bboxC.width * iw)
-                h = int(bboxC.height * ih)
-
-                zoom_factor = 1.2
-                new_size = int(max(w, h) * zoom_factor)
-                center_x, center_y = x1 + w // 2, y1 + h // 2
-                x1 = max(0, center_x - new_size // 2)
-                y1 = max(0, center_y - new_size // 2)
-                x2 = min(iw, center_x + new_size // 2)
-                y2 = min(ih, center_y + new_size // 2)
-
-                roi = frame[y1:y2, x1:x2]
-                if roi.size == 0:
-                    return None, False
-            else:
-                return None, False
-
-        # Redimensionar a tamaño objetivo
-        roi_resized = cv2.resize(roi, target_size, interpolation=cv2.INTER_AREA)
-        roi_gray = cv2.cvtColor(roi_resized, cv2.COLOR_BGR2GRAY)
-        roi_blur = cv2.GaussianBlur(roi_gray, (3, 3), 0)
-        roi_normalized = roi_blur / 255.0
-        roi_expanded = np.expand_dims(roi_normalized, axis=(0, -1))  # (1, 112, 112, 1)
+        # Con sesión, la caja del rostro se reutiliza entre frames y sólo se re-detecta cada N
+        start = time.perf_counter()
+        if token is not None and REDETECT_INTERVAL > 1:
+            box, detected = face_trackers.get(token).locate(frame, detect_with_pool)
+        else:
+            box, detected = detect_with_pool(frame)[0], True
+        stage_seconds["detect"].observe(time.perf_counter() - start)
+        if box is None:
+            return None, False
+
+        start = time.perf_counter()
+        roi_expanded = crop_and_normalize(frame, box, target_size)
+        stage_seconds["preprocess"].observe(time.perf_counter() - start)
+        if roi_expanded is None:
+            return None, False
+        if not detected and tracker_metrics.audit_due():
+            audit_tracked_box(frame, roi_expanded, target_size)
         return roi_expanded, True
 
     except Exception as e:
+        count_error("preprocess")
         print(f"Error en el preprocesamiento: {e}")
         return None, False
 
+def audit_tracked_box(frame, tracked_roi, target_size=(112, 112)):
+    """Compara la predicción con la caja reutilizada frente a la de una detección completa"""
+    box, _ = detect_with_pool(frame)
+    reference_roi = crop_and_normalize(frame, box, target_size) if box is not None else None
+    if reference_roi is None:
+        tracker_metrics.record_audit(False, 1.0)
+        return
+    tracked, reference = cnn_scheduler.submit(tracked_roi), cnn_scheduler.submit(reference_roi)
+    # En modo A/B la salida trae también la del candidato: se audita la del modelo activo
+    tracked, reference = (cnn_registry.select(tracked.result(FRAME_TIMEOUT), None),
+                           cnn_registry.select(reference.result(FRAME_TIMEOUT), None))
+    tracker_metrics.record_audit(int(np.argmax(tracked)) == int(np.argmax(reference)),
+                                 float(np.max(np.abs(tracked - reference))))
+
+def no_face_response(token):
+    return {
+        "gesture": 0,
+        "gesture_name": "No face detected",
+        "confidence": 0.0,
+        "token": token,
+    }
+
+def dropped_response(token, reason):
+    return {"error": "Frame descartado", "dropped": reason, "token": token}
+
+def analyze_frame(image_bytes, token, client_box=None, gesture_store=None):
+    """Procesa un frame codificado (JPEG) de la sesión y devuelve la respuesta para el frontend.
+
+    Si el cliente ya calculó la caja del rostro (relativa, como la de MediaPipe) se omite la detección.
+    Con `gesture_store` (sesión ya resuelta, como en /stream) no se busca la sesión por token.
+    """
+    start = time.perf_counter()
+    try:
+        return frame_pipeline.process(("jpeg", image_bytes, token, client_box, gesture_store), timeout=FRAME_TIMEOUT)
+    finally:
+        frame_seconds.observe(time.perf_counter() - start)
+
+def analyze_raw_roi(raw_bytes, token, gesture_store=None):
+    """Procesa una ROI gris de 112x112 ya recortada por el cliente (bytes uint8 crudos)"""
+    start = time.perf_counter()
+    try:
+        return frame_pipeline.process(("raw", raw_bytes, token, None, gesture_store), timeout=FRAME_TIMEOUT)
+    finally:
+        frame_seconds.observe(time.perf_counter() - start)
+
+def prepare_frame(item):
+    """Etapa 1 del pipeline: decodificación, preprocesamiento y caché de ROI -> (ROI o None, contexto)"""
+    kind, payload, token, client_box, gesture_store = item
+    if kind == "raw":
+        start = time.perf_counter()
+        roi_gray = parse_raw_roi(payload)
+        if roi_gray is None:
+            raise ValueError(f"La ROI cruda debe tener {112 * 112} bytes, se recibieron {len(payload)}")
+        roi_expanded = normalize_gray(roi_gray)
+        stage_seconds["preprocess"].observe(time.perf_counter() - start)
+    else:
+        start = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        stage_seconds["decode"].observe(time.perf_counter() - start)
+        if frame is None:
+            no_face_frames.inc()
+            return None, {"token": token, "response": no_face_response(token)}
+
+        # Preprocesar la imagen
+        if client_box is not None:
+            start = time.perf_counter()
+            roi_expanded = crop_and_normalize(frame, zoom_relative_box(client_box, frame.shape))
+            stage_seconds["preprocess"].observe(time.perf_counter() - start)
+            face_detected = roi_expanded is not None
+        else:
+            roi_expanded, face_detected = preprocess_image(frame, token=token)
+
+        if not face_detected:
+            no_face_frames.inc()
+            return None, {"token": token, "response": no_face_response(token)}
+
+    # Frames casi idénticos al anterior reutilizan su predicción
+    cache = roi_caches.get(token) if token is not None and ROI_CACHE_DISTANCE > 0 else None
+    prediction = cache.lookup(roi_expanded) if cache is not None else None
+    if prediction is not None:
+        return None, {"token": token, "session": gesture_store, "prediction": prediction}
+    return roi_expanded, {"token": token, "session": gesture_store, "roi": roi_expanded, "cache": cache}
+
+def finish_frame(context, prediction):
+    """Etapa 3 del pipeline: guarda la predicción de la CNN, actualiza la secuencia y calcula el índice"""
+    if "response" in context:
+        return context["response"]
+    if prediction is None:
+        prediction = context["prediction"]
+    elif context["cache"] is not None:
+        context["cache"].store(context["roi"], prediction)
+    # Con un candidato en modo A/B la sesión recibe la fila de su variante
+    return gesture_response(cnn_registry.select(prediction, context["token"]), context["token"], context["session"])
+
+def gesture_response(prediction, token, gesture_store=None):
+    """Respuesta para el frontend a partir de la predicción de la CNN"""
+    gesture_index = np.argmax(prediction) + 1
+    gesture_name = class_names[gesture_index - 1]
+    gesture_counts[gesture_name].inc()
+
+    # Actualizar la secuencia de gestos y calcular el índice
+    start = time.perf_counter()
+    update_gesture_sequence(gesture_name, token, gesture_store)
+    stage_seconds["sequence_update"].observe(time.perf_counter() - start)
+    start = time.perf_counter()
+    drowsiness_index = get_drowsiness_index(token, gesture_store)
+    stage_seconds["index"].observe(time.perf_counter() - start)
+    adjusted_drowsiness_index = drowsiness_index/100
+
+    if startup["first_prediction"] is None:
+        startup["first_prediction"] = time.perf_counter()
+        print(f"⏱️ Primera predicción a los {startup['first_prediction'] - startup['process_started']:.1f} s del arranque")
+
+    return {
+        "gesture": int(gesture_index),
+        "gesture_name": gesture_name,
+        "confidence": adjusted_drowsiness_index,
+        "token": token,
+    }
+
+# Decodificación/preprocesamiento en un pool -> CNN en lote -> secuencia e índice
+frame_pipeline = StagedPipeline(
+    prepare_frame,
+    cnn_scheduler,
+    finish_frame,
+    prepare_workers=PREPROCESS_WORKERS,
+    finish_workers=POSTPROCESS_WORKERS,
+    max_pending=PIPELINE_MAX_PENDING
+)
+
 # ================= RUTAS FLASK =================
+def loading_response():
+    """503 mientras los modelos se cargan, para que el cliente o el balanceador reintenten"""
+    response = jsonify({"error": "El servidor está cargando los modelos", "loading": True})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+def bearer_token():
+    """Token del header Authorization (si existe)"""
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1]
+    return None
+
 @app.route("/process-image", methods=["POST"])
 def process_image():
     try:
-        # Extraer el token del header (si existe)
-        auth_header = request.headers.get("Authorization")
-        token = None
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
+        token = bearer_token()
+        if not models_ready.is_set():
+            return loading_response()
 
         if "image" not in request.files:
-            return (
-                jsonify(
-                    {
-                        "gesture": 0,
-                        "gesture_name": "No face detected",
-                        "confidence": 0.0,
-                        "token": token,
-                    }
-                ),
-                400,
-            )
-
-        # Leer la imagen enviada desde el frontend
-        image_file = request.files["image"]
-        image_bytes = np.frombuffer(image_file.read(), np.uint8)
-        frame = cv2.imdecode(image_bytes, cv2.IMREAD_COLOR)
+            return jsonify(no_face_response(token)), 400
 
-        # Preprocesar la imagen
-        roi_expanded, face_detected = preprocess_image(frame)
+        # Caja del rostro opcional calculada en el cliente: "xmin,ymin,ancho,alto" relativos
+        client_box = None
+        if "box" in request.form:
+            client_box = parse_relative_box(request.form["box"])
+            if client_box is None:
+                return jsonify({"error": "Caja de rostro no válida"}), 400
 
-        if not face_detected:
-            return (
-                jsonify(
-                    {
-                        "gesture": 0,
-                        "gesture_name": "No face detected",
-                        "confidence": 0.0,
-                        "token": token,
-                    }
-                ),
-                200,
-            )
-
-        # Realizar la predicción con el modelo CNN
-        prediction = cnn_model.predict(roi_expanded)
-        gesture_index = np.argmax(prediction) + 1
-        gesture_name = class_names[gesture_index - 1]
-
-        print(f"Predicción: {gesture_name} ({gesture_index})")
-        
-        # Actualizar la secuencia de gestos y calcular el índice
-        update_gesture_sequence(gesture_name)
-        drowsiness_index = get_drowsiness_index()
-        adjusted_drowsiness_index = drowsiness_index/100
-        
-        # Devolver el resultado al frontend
-        return (
-            jsonify(
-                {
-                    "gesture": int(gesture_index),
-                    "gesture_name": gesture_name,
-                    "confidence": adjusted_drowsiness_index,
-                    "token": token,
-                }
-            ),
-            200,
-        )
+        # Leer la imagen enviada desde el frontend y devolver el resultado
+        image_bytes = request.files["image"].read()
+        try:
+            result = frame_admission.run(token, lambda: analyze_frame(image_bytes, token, client_box))
+        except FrameDropped as e:
+            # Llegó un frame más reciente de la misma sesión o este esperó demasiado
+            return jsonify(dropped_response(token, e.reason)), 429
+        return jsonify(result), 200
 
     except Exception as e:
+        count_error("request")
         print(f"Error procesando la imagen: {e}")
         return jsonify({"error": "Error procesando la imagen"}), 500
 
+@app.route("/process-roi", methods=["POST"])
+def process_roi():
+    """Ruta rápida: el cuerpo son los 112x112 bytes de la ROI en gris, sin JPEG ni detección"""
+    try:
+        token = bearer_token()
+        if not models_ready.is_set():
+            return loading_response()
+        raw_bytes = request.get_data(cache=False)
+        if len(raw_bytes) != 112 * 112:
+            return jsonify({"error": f"La ROI cruda debe tener {112 * 112} bytes"}), 400
+        try:
+            result = frame_admission.run(token, lambda: analyze_raw_roi(raw_bytes, token))
+        except FrameDropped as e:
+            return jsonify(dropped_response(token, e.reason)), 429
+        return jsonify(result), 200
+
+    except Exception as e:
+        count_error("request")
+        print(f"Error procesando la ROI: {e}")
+        return jsonify({"error": "Error procesando la ROI"}), 500
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: el proceso responde, aunque los modelos aún se estén cargando"""
+    return jsonify({"status": "ok"}), 200
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 sólo cuando los modelos están cargados y calentados"""
+    if models_ready.is_set():
+        status, code = "ready", 200
+    else:
+        status, code = ("error" if startup["error"] else "loading"), 503
+    return jsonify({"status": status, "error": startup["error"], "startup_seconds": startup_seconds()}), code
+
+@app.route("/admission-stats", methods=["GET"])
+def admission_stats():
+    """Contadores de frames admitidos y descartados por la política de backpressure"""
+    return jsonify(frame_admission.snapshot()), 200
+
+@app.route("/tracker-stats", methods=["GET"])
+def tracker_stats():
+    """Proporción de detecciones evitadas por el tracker y resultado de las auditorías"""
+    return jsonify(tracker_metrics.snapshot()), 200
+
+@app.route("/roi-cache-stats", methods=["GET"])
+def roi_cache_stats():
+    """Tasa de aciertos de la caché de predicciones por ROI casi idéntica"""
+    return jsonify(roi_cache_metrics.snapshot()), 200
+
+@app.route("/index-cache-stats", methods=["GET"])
+def index_cache_stats():
+    """Aciertos, fallos y expulsiones de la caché del índice por ventana"""
+    if index_cache is None:
+        return jsonify({"enabled": False, "backend": INDEX_BACKEND}), 200
+    return jsonify({"enabled": True, "backend": INDEX_BACKEND, **index_cache.snapshot()}), 200
+
+def model_file(name, kind):
+    """Ruta de un modelo de MODELS_DIR del tipo indicado, o None si no existe"""
+    if list_models(MODELS_DIR).get(name) != kind:
+        return None
+    return os.path.join(MODELS_DIR, name)
+
+def admin_required(func):
+    """Los cambios de modelo exigen el token de VIGIL_ADMIN_TOKEN"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Cambios de modelo deshabilitados (defina VIGIL_ADMIN_TOKEN)"}), 403
+        if not hmac.compare_digest(bearer_token() or "", ADMIN_TOKEN):
+            return jsonify({"error": "No autorizado"}), 401
+        if not models_ready.is_set():
+            return loading_response()
+        return func(*args, **kwargs)
+    return wrapper
+
+@app.route("/models", methods=["GET"])
+def models_status():
+    """Modelos disponibles, CNN activa, candidato y su concordancia, y modelo del índice"""
+    status = cnn_registry.snapshot() if cnn_registry is not None else {}
+    return jsonify({
+        "available": list_models(MODELS_DIR),
+        "cnn": status,
+        "index": os.path.basename(index_model_path),
+    }), 200
+
+@app.route("/models/activate", methods=["POST"])
+@admin_required
+def activate_model():
+    """Carga, calienta y pone en servicio un modelo: {"name": "model1805.h5"}"""
+    name = (request.get_json(silent=True) or {}).get("name", "")
+    kind = list_models(MODELS_DIR).get(name)
+    if kind is None:
+        return jsonify({"error": f"Modelo desconocido: {name}"}), 404
+    try:
+        if kind == "index":
+            activate_index_model(os.path.join(MODELS_DIR, name))
+        else:
+            cnn_registry.activate(os.path.join(MODELS_DIR, name))
+    except Exception as e:
+        print(f"❌ No se pudo activar el modelo {name}: {e}")
+        return jsonify({"error": f"No se pudo activar el modelo: {e}"}), 500
+    return models_status()
+
+@app.route("/models/candidate", methods=["POST", "DELETE"])
+@admin_required
+def candidate_model():
+    """Evalúa una CNN candidata sobre las mismas ROIs: {"name", "mode": "shadow"|"ab", "fraction"}"""
+    if request.method == "DELETE":
+        cnn_registry.clear_candidate()
+        return models_status()
+    body = request.get_json(silent=True) or {}
+    path = model_file(body.get("name", ""), "cnn")
+    if path is None:
+        return jsonify({"error": f"CNN desconocida: {body.get('name')}"}), 404
+    try:
+        cnn_registry.set_candidate(path, body.get("mode", "shadow"), float(body.get("fraction", 0.0)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"❌ No se pudo cargar el candidato {path}: {e}")
+        return jsonify({"error": f"No se pudo cargar el modelo: {e}"}), 500
+    return models_status()
+
+metrics.gauge("startup_seconds", "Segundos desde el arranque hasta cargar los modelos y hasta la primera predicción",
+              startup_seconds)
+metrics.gauge("ready", "1 si los modelos están cargados", lambda: float(models_ready.is_set()))
+metrics.gauge("sessions", "Sesiones con secuencia de gestos en memoria", lambda: len(gesture_sessions))
+metrics.gauge("admission", "Contadores de la política de backpressure", frame_admission.snapshot)
+metrics.gauge("face_tracker", "Detecciones evitadas por el tracker de rostro", tracker_metrics.snapshot)
+metrics.gauge("roi_cache", "Caché de predicciones por ROI casi idéntica", roi_cache_metrics.snapshot)
+metrics.gauge("gesture_log", "Registros del diario de gestos",
+              lambda: gesture_log.snapshot() if gesture_log is not None else {})
+metrics.gauge("model_comparison", "Concordancia de la CNN candidata con la activa",
+              lambda: {key: value for key, value in cnn_registry.comparison.snapshot().items() if key != "confusion"}
+              if cnn_registry is not None and cnn_registry.candidate is not None else {})
+if index_cache is not None:
+    metrics.gauge("index_cache", "Caché del índice por ventana", lambda: index_cache.snapshot())
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ================= STREAMING (WEBSOCKET) =================
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route("/stream")
+    def stream_frames(ws):
+        """Recibe frames JPEG binarios por una conexión persistente y responde a cada uno en orden.
+
+        El navegador no puede enviar el header Authorization en un WebSocket, así que el
+        token llega en el primer mensaje de texto ({"token": "..."}). La URL sólo lleva
+        ?session=, una clave no secreta para el balanceador, porque queda en los logs.
+        Con {"format": "raw"} los frames siguientes son ROIs grises de 112x112 bytes crudos.
+        """
+        token = None
+        frame_format = "jpeg"
+        pending_control = None
+        # La sesión se resuelve una vez por conexión (y al cambiar de token), no en cada frame.
+        # Se vuelve a pedir cada medio TTL para que el barrido no la expulse mientras sigue activa.
+        gesture_store, resolved_at = None, 0.0
+        while True:
+            if pending_control is not None:
+                message, pending_control = pending_control, None
+            else:
+                message = ws.receive()
+            if message is None:
+                break
+            if isinstance(message, str):
+                try:
+                    control = json.loads(message)
+                    if control.get("token", token) != token:
+                        token, gesture_store = control["token"], None
+                    frame_format = control.get("format", frame_format)
+                except (ValueError, AttributeError):
+                    ws.send(json.dumps({"error": "Mensaje de control no válido"}))
+                continue
+            # Si se acumularon frames mientras se procesaba el anterior, sólo se atiende el último;
+            # cada frame descartado recibe su respuesta para que el cliente las siga en orden.
+            # Un mensaje de control corta el drenaje: se aplica después de este frame, en su orden.
+            while True:
+                queued = ws.receive(timeout=0)
+                if queued is None:
+                    break
+                if isinstance(queued, str):
+                    pending_control = queued
+                    break
+                frame_admission.record_superseded()
+                ws.send(json.dumps(dropped_response(token, "superseded")))
+                message = queued
+            if not models_ready.is_set():
+                ws.send(json.dumps({"error": "El servidor está cargando los modelos", "loading": True}))
+                continue
+            if gesture_store is None or time.monotonic() - resolved_at > SESSION_TTL / 2:
+                gesture_store, resolved_at = gesture_sessions.get(token), time.monotonic()
+            try:
+                analyze = analyze_raw_roi if frame_format == "raw" else analyze_frame
+                result = frame_admission.run(token, lambda: analyze(message, token, gesture_store=gesture_store))
+            except FrameDropped as e:
+                result = dropped_response(token, e.reason)
+            except Exception as e:
+                count_error("stream")
+                print(f"Error procesando la imagen: {e}")
+                result = {"error": "Error procesando la imagen"}
+            ws.send(json.dumps(result))
+
 # ================= INICIO =================
+def shutdown():
+    """Libera los recursos del proceso: termina los frames en curso y escribe las instantáneas pendientes"""
+    frame_pipeline.close()
+    cnn_scheduler.close()
+    if cnn_registry is not None:
+        cnn_registry.close()
+    if face_detector_pool is not None:
+        face_detector_pool.close()
+    if snapshot_exporter is not None:
+        snapshot_exporter.close(timeout=10)
+    if gesture_log is not None:
+        gesture_log.close(timeout=10)
+    if session_sweeper is not None:
+        session_sweeper.close(timeout=10)
+
 if __name__ == "__main__":
     initialize_excel()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,95 @@
+import threading
+
+
+class FrameDropped(Exception):
+    """El frame se descartó por la política de admisión ('superseded' o 'stale')"""
+
+    def __init__(self, reason):
+        super().__init__(f"Frame descartado ({reason})")
+        self.reason = reason
+
+
+class _Ticket:
+    __slots__ = ('event', 'dropped')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.dropped = None
+
+
+class _Slot:
+    __slots__ = ('busy', 'pending')
+
+    def __init__(self):
+        self.busy = False
+        self.pending = None
+
+
+class FrameAdmission:
+    """Política de admisión por sesión: un frame en proceso y, como mucho, uno en espera.
+
+    Si llega un frame nuevo mientras otro espera, el que espera se descarta
+    ('superseded'): sólo interesa el más reciente. Un frame que espera más de
+    `max_wait` segundos también se descarta ('stale'). Así la latencia queda acotada
+    a unos dos tiempos de proceso aunque el cliente envíe más rápido de lo que se atiende.
+    """
+
+    def __init__(self, max_wait=1.0):
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._stats = {'admitted': 0, 'completed': 0, 'superseded': 0, 'stale': 0}
+
+    def run(self, token, fn):
+        """Ejecuta fn() para la sesión respetando la política; lanza FrameDropped si se descarta"""
+        ticket = None
+        with self._lock:
+            slot = self._slots.get(token)
+            if slot is None:
+                slot = self._slots[token] = _Slot()
+            if not slot.busy:
+                slot.busy = True
+            else:
+                if slot.pending is not None:
+                    slot.pending.dropped = 'superseded'
+                    slot.pending.event.set()
+                    self._stats['superseded'] += 1
+                ticket = slot.pending = _Ticket()
+
+        if ticket is not None:
+            ticket.event.wait(self.max_wait)
+            with self._lock:
+                if ticket.dropped:
+                    raise FrameDropped(ticket.dropped)
+                if not ticket.event.is_set():
+                    # Nadie le cedió el turno a tiempo: el frame ya es viejo
+                    slot.pending = None
+                    self._stats['stale'] += 1
+                    raise FrameDropped('stale')
+                # Turno cedido por el frame anterior: slot.busy sigue en True
+
+        with self._lock:
+            self._stats['admitted'] += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._stats['completed'] += 1
+                if slot.pending is not None:
+                    successor, slot.pending = slot.pending, None
+                    successor.event.set()
+                else:
+                    slot.busy = False
+                    del self._slots[token]
+
+    def record_superseded(self, count=1):
+        """Cuenta frames descartados antes de llegar a run() (p. ej. mensajes acumulados en un WebSocket)"""
+        with self._lock:
+            self._stats['superseded'] += count
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._slots)
+            stats['dropped'] = stats['superseded'] + stats['stale']
+        return stats
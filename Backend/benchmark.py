@@ -0,0 +1,256 @@
+"""Benchmark por etapas del pipeline de /process-image.
+
+Reproduce una carpeta de imágenes o un video a través de cada etapa de process_image
+(decodificación, detección, recorte/normalización, CNN, actualización de la secuencia e
+índice) y guarda latencias p50/p95/p99, throughput y memoria pico en un JSON.
+
+Con --index-model mide además el motor NumPy del índice (NumpyDrowsinessModel) por lote
+y sobre una secuencia larga con score_sequence(); sin carpeta ni video mide sólo eso.
+
+Uso:
+    python benchmark.py frames/ [--repeat 3] [--output bench_results.json]
+    python benchmark.py video.mp4 --limit 500
+    python benchmark.py --index-model models/Modelo_6_capas.h5
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+STAGES = ["decode", "detect", "preprocess", "cnn", "sequence_update", "index"]
+
+
+def iter_jpeg_frames(source, limit=None, jpeg_quality=92):
+    """Genera los frames como bytes JPEG, igual que los envía el frontend"""
+    count = 0
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "**", "*"), recursive=True)
+                       if p.lower().endswith(IMAGE_EXTENSIONS))
+        for path in paths:
+            with open(path, "rb") as f:
+                yield f.read()
+            count += 1
+            if limit and count >= limit:
+                return
+    else:
+        capture = cv2.VideoCapture(source)
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+                if ok:
+                    yield encoded.tobytes()
+                    count += 1
+                    if limit and count >= limit:
+                        return
+        finally:
+            capture.release()
+
+
+def peak_rss_bytes():
+    """Memoria residente pico del proceso, o None si la plataforma no la expone"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KiB y macOS en bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return {'count': 0}
+    samples = np.asarray(samples_ms)
+    return {
+        'count': int(samples.size),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(frames, repeat=1, token="benchmark"):
+    """Pasa cada frame por todas las etapas y devuelve los tiempos por etapa (ms)"""
+    import CNN
+    from preprocessing import detect_face_box, crop_and_normalize
+    CNN.wait_until_ready()
+
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    no_face = 0
+    start_all = time.perf_counter()
+    for _ in range(repeat):
+        for jpeg in frames:
+            frame_start = time.perf_counter()
+
+            t = time.perf_counter()
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            timings['decode'].append((time.perf_counter() - t) * 1000)
+
+            t = time.perf_counter()
+            with CNN.face_detector_pool.acquire() as face_detection:
+                box = detect_face_box(frame, face_detection)
+            timings['detect'].append((time.perf_counter() - t) * 1000)
+            if box is None:
+                no_face += 1
+                totals.append((time.perf_counter() - frame_start) * 1000)
+                continue
+
+            t = time.perf_counter()
+            roi = crop_and_normalize(frame, box)
+            timings['preprocess'].append((time.perf_counter() - t) * 1000)
+            if roi is None:
+                no_face += 1
+                totals.append((time.perf_counter() - frame_start) * 1000)
+                continue
+
+            t = time.perf_counter()
+            prediction = CNN.cnn_registry.active(roi)[0]
+            timings['cnn'].append((time.perf_counter() - t) * 1000)
+            gesture_name = CNN.class_names[int(np.argmax(prediction))]
+
+            t = time.perf_counter()
+            CNN.update_gesture_sequence(gesture_name, token)
+            timings['sequence_update'].append((time.perf_counter() - t) * 1000)
+
+            t = time.perf_counter()
+            CNN.get_drowsiness_index(token)
+            timings['index'].append((time.perf_counter() - t) * 1000)
+
+            totals.append((time.perf_counter() - frame_start) * 1000)
+    elapsed = time.perf_counter() - start_all
+    return timings, totals, no_face, elapsed
+
+
+def random_gesture_windows(count, window=240, seed=0):
+    """Ventanas de gestos codificados (0-2) aleatorias, con rachas de longitud variable"""
+    rng = np.random.default_rng(seed)
+    windows = np.empty((count, window), dtype=np.uint8)
+    for i in range(count):
+        # Mezcla de ventanas casi constantes y muy fragmentadas
+        mean_run = rng.choice([1.5, 4, 12, 60, 400])
+        probs = rng.dirichlet(np.ones(3))
+        seq = []
+        while len(seq) < window:
+            seq.extend([rng.choice(3, p=probs)] * int(rng.geometric(1.0 / mean_run)))
+        windows[i] = seq[:window]
+    return windows
+
+
+def benchmark_index_engine(model_path, batch_sizes=(1, 10000), repeats=20, sequence_length=1_000_000):
+    """Microsegundos por llamada/ventana de NumpyDrowsinessModel.predict y ventanas/s de score_sequence"""
+    from drowsiness_engine import ATTENTION, NumpyDrowsinessModel
+
+    engine = NumpyDrowsinessModel.from_h5(model_path)
+    results = {'batches': {}}
+    for batch_size in batch_sizes:
+        windows = random_gesture_windows(batch_size, seed=batch_size)
+        engine.predict(windows)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            engine.predict(windows)
+        per_call = (time.perf_counter() - start) / repeats * 1e6
+        results['batches'][batch_size] = {'us_per_call': per_call, 'us_per_window': per_call / batch_size}
+
+    codes = random_gesture_windows(1, window=sequence_length, seed=sequence_length)[0]
+    start = time.perf_counter()
+    engine.score_sequence(codes, initial=ATTENTION)
+    elapsed = time.perf_counter() - start
+    results['sequence'] = {'length': sequence_length, 'seconds': elapsed, 'windows_per_second': sequence_length / elapsed}
+    return results
+
+
+def print_index_engine(results):
+    for batch_size, stats in results['batches'].items():
+        print(f"Motor NumPy, lote de {batch_size}: {stats['us_per_call']:.1f} µs/llamada, "
+              f"{stats['us_per_window']:.2f} µs/ventana")
+    stats = results['sequence']
+    print(f"Secuencia de {stats['length']:,} pasos: {stats['seconds']:.2f} s "
+          f"({stats['windows_per_second']:,.0f} ventanas/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", help="Carpeta de imágenes o archivo de video")
+    parser.add_argument("--repeat", type=int, default=1, help="Veces que se reproduce el conjunto de frames")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de frames a cargar")
+    parser.add_argument("--warmup", type=int, default=5, help="Frames iniciales que no se miden")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--index-model", default=None, help="Modelo del índice (.h5) para medir el motor NumPy")
+    args = parser.parse_args()
+    if args.source is None and args.index_model is None:
+        parser.error("Indique una carpeta de imágenes, un video o --index-model")
+
+    index_engine = benchmark_index_engine(args.index_model) if args.index_model else None
+    if args.source is None:
+        print_index_engine(index_engine)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"), 'revision': git_revision(),
+                       'index_engine': index_engine}, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+        return
+
+    frames = list(iter_jpeg_frames(args.source, limit=args.limit))
+    if not frames:
+        parser.error(f"No se encontraron frames en {args.source}")
+    if args.warmup:
+        run(frames[:args.warmup], token="benchmark-warmup")
+
+    timings, totals, no_face, elapsed = run(frames, repeat=args.repeat)
+    processed = len(totals)
+    result = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'revision': git_revision(),
+        'source': args.source,
+        'frames': processed,
+        'no_face_frames': no_face,
+        'elapsed_s': elapsed,
+        'throughput_fps': processed / elapsed if elapsed else None,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'config': {k: v for k, v in os.environ.items() if k.startswith("VIGIL_")},
+        'stages': {stage: summarize(samples) for stage, samples in timings.items()},
+        'total': summarize(totals),
+    }
+    if index_engine is not None:
+        result['index_engine'] = index_engine
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    for stage in STAGES + ['total']:
+        stats = result['stages'].get(stage, result['total'])
+        if stats['count']:
+            print(f"{stage:>16}: p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+    print(f"{processed} frames en {elapsed:.2f} s ({result['throughput_fps']:.1f} fps), "
+          f"sin rostro: {no_face}, RSS pico: {(result['peak_rss_bytes'] or 0) / 2**20:.0f} MiB")
+    if index_engine is not None:
+        print_index_engine(index_engine)
+    print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+from .constraints import MinMaxValueConstraint
+from .layers import (
+    DrowsinessIndexLayer,
+    AttentionConsecutiveAdjustment,
+    EyesClosedConsecutiveAdjustment,
+    YawningConsecutiveAdjustment,
+    CombinedConsecutiveAdjustment,
+    ExtremeValueAdjustment
+)
+
+# Objetos necesarios para tf.keras.models.load_model() con los modelos de secuencia
+CUSTOM_OBJECTS = {
+    'MinMaxValueConstraint': MinMaxValueConstraint,
+    'DrowsinessIndexLayer': DrowsinessIndexLayer,
+    'AttentionConsecutiveAdjustment': AttentionConsecutiveAdjustment,
+    'EyesClosedConsecutiveAdjustment': EyesClosedConsecutiveAdjustment,
+    'YawningConsecutiveAdjustment': YawningConsecutiveAdjustment,
+    'CombinedConsecutiveAdjustment': CombinedConsecutiveAdjustment,
+    'ExtremeValueAdjustment': ExtremeValueAdjustment
+}
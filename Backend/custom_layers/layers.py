@@ -71,29 +71,12 @@ class AttentionConsecutiveAdjustment(tf.keras.layers.Layer):
         gestures = tf.squeeze(gesture_sequence, axis=-1)
         attention_mask = tf.cast(tf.equal(gestures, 0), tf.float32)
 
-        def calculate_max_streak(mask):
-            mask_1d = tf.squeeze(mask)
-            streaks = tf.math.cumsum(mask_1d) * mask_1d
-            return tf.cast(tf.reduce_max(streaks), tf.float32)
-
-        max_streaks = tf.map_fn(
-            calculate_max_streak,
-            attention_mask,
-            fn_output_signature=tf.float32
-        )
-        max_streaks = tf.reshape(max_streaks, (-1, 1))
-
-        def compute_reduction(streak):
-            excess = tf.maximum(streak - self.activation_threshold, 0.0)
-            scale = tf.math.log(1.0 + excess / (self.saturation_point - self.activation_threshold + 1e-7))
-            return self.max_reduction * tf.tanh(scale)
+        streaks = tf.math.cumsum(attention_mask, axis=1) * attention_mask
+        max_streaks = tf.reduce_max(streaks, axis=1, keepdims=True)
 
-        reduction = tf.map_fn(
-            compute_reduction,
-            max_streaks,
-            fn_output_signature=tf.float32
-        )
-        reduction = tf.reshape(reduction, (-1, 1))
+        excess = tf.maximum(max_streaks - self.activation_threshold, 0.0)
+        scale = tf.math.log(1.0 + excess / (self.saturation_point - self.activation_threshold + 1e-7))
+        reduction = self.max_reduction * tf.tanh(scale)
 
         adjusted_index = drowsiness_index * (1.0 - reduction)
         adjusted_index = tf.clip_by_value(adjusted_index, self.min_output, self.max_output)
@@ -122,23 +105,12 @@ class EyesClosedConsecutiveAdjustment(tf.keras.layers.Layer):
         gestures = tf.squeeze(gesture_sequence, axis=-1)
         eyesclosed_mask = tf.cast(tf.equal(gestures, 1), tf.float32)
 
-        def calculate_adjustment(mask):
-            mask_1d = tf.squeeze(mask)
-            streaks = tf.math.cumsum(mask_1d) * mask_1d
-            max_streak = tf.reduce_max(streaks)
-            max_streak = tf.cast(max_streak, tf.float32)
-            safe_saturation_point = tf.maximum(1.0, tf.cast(self.saturation_point - self.initial_threshold, dtype=tf.float32))
-            saturation = tf.sigmoid((max_streak - self.initial_threshold) / safe_saturation_point * self.saturation_strength)
-            adjustment = self.max_adjustment * saturation
-            adjustment = tf.where(max_streak >= self.initial_threshold, adjustment, tf.constant(0.0, dtype=tf.float32))
-            return adjustment
-
-        streak_adjustments = tf.map_fn(
-            calculate_adjustment,
-            eyesclosed_mask,
-            fn_output_signature=tf.float32
-        )
-        streak_adjustments = tf.reshape(streak_adjustments, (-1, 1))
+        streaks = tf.math.cumsum(eyesclosed_mask, axis=1) * eyesclosed_mask
+        max_streak = tf.reduce_max(streaks, axis=1, keepdims=True)
+        safe_saturation_point = tf.maximum(1.0, tf.cast(self.saturation_point - self.initial_threshold, dtype=tf.float32))
+        saturation = tf.sigmoid((max_streak - self.initial_threshold) / safe_saturation_point * self.saturation_strength)
+        adjustment = self.max_adjustment * saturation
+        streak_adjustments = tf.where(max_streak >= self.initial_threshold, adjustment, tf.constant(0.0, dtype=tf.float32))
 
         return tf.clip_by_value(drowsiness_index + streak_adjustments, 0.0, 1.0)
 
@@ -173,32 +145,35 @@ class YawningConsecutiveAdjustment(tf.keras.layers.Layer):
         gestures = tf.squeeze(gesture_sequence, axis=-1)
         yawning_mask = tf.cast(tf.equal(gestures, 2), tf.float32)
 
-        def process_sample(mask):
-            mask_1d = tf.squeeze(mask)
-            changes = tf.not_equal(mask_1d[:-1], mask_1d[1:])
-            indices = tf.squeeze(tf.where(changes), axis=-1)
-            indices = tf.concat([[0], indices + 1, [tf.size(mask_1d)]], axis=0)
-            streak_lengths = indices[1:] - indices[:-1]
-            is_yawning_streak = tf.equal(tf.gather(mask_1d, indices[:-1]), 1.0)
-            streak_lengths = tf.boolean_mask(streak_lengths, is_yawning_streak)
+        # Las rachas se numeran de forma consecutiva en todo el lote: cada fila abre una
+        # racha nueva en su primera posición, así que ninguna racha cruza de una fila a otra
+        batch_size = tf.shape(yawning_mask)[0]
+        seq_len = tf.shape(yawning_mask)[1]
+        changes = tf.concat([
+            tf.ones((batch_size, 1), dtype=tf.int32),
+            tf.cast(tf.not_equal(yawning_mask[:, :-1], yawning_mask[:, 1:]), tf.int32)
+        ], axis=1)
+        run_ids = tf.reshape(tf.math.cumsum(changes, axis=1) + tf.math.cumsum(tf.reduce_sum(changes, axis=1), exclusive=True)[:, None], [-1]) - 1
+        rows = tf.reshape(tf.tile(tf.range(batch_size)[:, None], [1, seq_len]), [-1])
 
-            high_impact = tf.reduce_sum(tf.cast(streak_lengths >= self.min_streak_high_impact, tf.int32))
-            low_impact = tf.reduce_sum(tf.cast(streak_lengths >= self.min_streak_low_impact, tf.int32))
+        streak_lengths = tf.math.segment_sum(tf.ones_like(run_ids), run_ids)
+        is_yawning_streak = tf.equal(tf.math.segment_max(tf.reshape(yawning_mask, [-1]), run_ids), 1.0)
+        streak_rows = tf.math.segment_max(rows, run_ids)
 
-            high_adjust = self.high_impact_initial * tf.exp(-self.high_decay_rate * tf.cast(high_impact - self.min_streaks_high_activate, tf.float32))
-            high_adjust = tf.where(high_impact >= self.min_streaks_high_activate, high_adjust, 0.0)
+        def count_streaks(min_length):
+            long_streaks = tf.cast(tf.logical_and(is_yawning_streak, streak_lengths >= min_length), tf.int32)
+            return tf.math.unsorted_segment_sum(long_streaks, streak_rows, batch_size)
 
-            low_adjust = self.low_impact_initial * tf.exp(-self.low_decay_rate * tf.cast(low_impact - self.min_streaks_low_activate, tf.float32))
-            low_adjust = tf.where(low_impact >= self.min_streaks_low_activate, low_adjust, 0.0)
+        high_impact = count_streaks(self.min_streak_high_impact)
+        low_impact = count_streaks(self.min_streak_low_impact)
 
-            total_adjust = high_adjust + low_adjust
-            return tf.minimum(total_adjust, self.max_adjustment)
+        high_adjust = self.high_impact_initial * tf.exp(-self.high_decay_rate * tf.cast(high_impact - self.min_streaks_high_activate, tf.float32))
+        high_adjust = tf.where(high_impact >= self.min_streaks_high_activate, high_adjust, 0.0)
 
-        adjustments = tf.map_fn(
-            process_sample,
-            yawning_mask,
-            fn_output_signature=tf.float32
-        )
+        low_adjust = self.low_impact_initial * tf.exp(-self.low_decay_rate * tf.cast(low_impact - self.min_streaks_low_activate, tf.float32))
+        low_adjust = tf.where(low_impact >= self.min_streaks_low_activate, low_adjust, 0.0)
+
+        adjustments = tf.minimum(high_adjust + low_adjust, self.max_adjustment)
         adjustments = tf.reshape(adjustments, (-1, 1))
 
         adjusted_index = drowsiness_index + adjustments
@@ -237,26 +212,13 @@ class CombinedConsecutiveAdjustment(tf.keras.layers.Layer):
         eyesclosed_mask = tf.cast(tf.equal(gestures, 1), tf.float32)
         attention_mask = tf.cast(tf.equal(gestures, 0), tf.float32)
 
-        batch_size = tf.shape(gestures)[0]
-
-        def process_batch_element(i):
-            current_eyesclosed = eyesclosed_mask[i]
-            current_attention = attention_mask[i]
-            eyesclosed_streaks = tf.math.cumsum(current_eyesclosed) * current_eyesclosed
-            max_eyesclosed_streak = tf.reduce_max(eyesclosed_streaks)
-
-            adjustment = tf.cond(
-                max_eyesclosed_streak >= self.eyesclosed_threshold,
-                lambda: self._calculate_attention_adjustment(current_attention, eyesclosed_streaks),
-                lambda: tf.constant(0.0, dtype=tf.float32)
-            )
-            return adjustment
-
-        adjustments = tf.map_fn(
-            process_batch_element,
-            tf.range(batch_size),
-            fn_output_signature=tf.float32
-        )
+        eyesclosed_streaks = tf.math.cumsum(eyesclosed_mask, axis=1) * eyesclosed_mask
+        max_eyesclosed_streak = tf.reduce_max(eyesclosed_streaks, axis=1)
+        max_attention_streak = self._max_attention_after(attention_mask, eyesclosed_streaks)
+
+        active = tf.logical_and(max_eyesclosed_streak >= self.eyesclosed_threshold,
+                                max_attention_streak >= self.attention_threshold)
+        adjustments = tf.where(active, self._compute_adjustment_value(max_attention_streak), tf.constant(0.0, dtype=tf.float32))
         adjustments = tf.reshape(adjustments, (-1, 1))
 
         adjusted_index = drowsiness_index * (1.0 - adjustments)
@@ -265,17 +227,13 @@ class CombinedConsecutiveAdjustment(tf.keras.layers.Layer):
 
         return adjusted_index
 
-    def _calculate_attention_adjustment(self, attention_mask, eyesclosed_streaks):
-        max_streak_pos = tf.argmax(eyesclosed_streaks)
-        attention_after = attention_mask[max_streak_pos+1:]
-        attention_streaks = tf.math.cumsum(attention_after) * attention_after
-        max_attention_streak = tf.reduce_max(attention_streaks)
-
-        return tf.cond(
-            max_attention_streak >= self.attention_threshold,
-            lambda: self._compute_adjustment_value(max_attention_streak),
-            lambda: tf.constant(0.0, dtype=tf.float32)
-        )
+    def _max_attention_after(self, attention_mask, eyesclosed_streaks):
+        # Sólo cuenta la atención posterior a la posición del máximo de eyesclosed_streaks
+        max_streak_pos = tf.argmax(eyesclosed_streaks, axis=1, output_type=tf.int32)
+        positions = tf.range(tf.shape(attention_mask)[1])[None, :]
+        attention_after = attention_mask * tf.cast(positions > max_streak_pos[:, None], tf.float32)
+        attention_streaks = tf.math.cumsum(attention_after, axis=1) * attention_after
+        return tf.reduce_max(attention_streaks, axis=1)
 
     def _compute_adjustment_value(self, max_attention_streak):
         excess = tf.maximum(max_attention_streak - self.attention_threshold, 0.0)
@@ -310,13 +268,8 @@ class ExtremeValueAdjustment(tf.keras.layers.Layer):
     def _apply_eyesclosed_adjustment(self, index, gestures):
         eyesclosed_mask = tf.cast(tf.equal(gestures, 1), tf.int32)
 
-        def calculate_final_streak(mask):
-            reversed_mask = tf.reverse(mask, axis=[0])
-            streak = tf.argmax(tf.not_equal(reversed_mask, 1), output_type=tf.int32)
-            is_all = tf.reduce_all(tf.equal(mask, 1))
-            return tf.where(is_all, tf.shape(mask)[0], streak)
-
-        final_streaks = tf.map_fn(calculate_final_streak, eyesclosed_mask, fn_output_signature=tf.int32)
+        # Racha final: producto acumulado de la máscara invertida (se anula en el primer 0)
+        final_streaks = tf.reduce_sum(tf.math.cumprod(tf.reverse(eyesclosed_mask, axis=[1]), axis=1), axis=1)
 
         def compute_increment(streak):
                 streak_f = tf.cast(streak, tf.float32)
@@ -341,20 +294,16 @@ class ExtremeValueAdjustment(tf.keras.layers.Layer):
 
                 return increment
 
-        increments = tf.map_fn(compute_increment, final_streaks, fn_output_signature=tf.float32)
+        increments = compute_increment(final_streaks)
         safe_increment = tf.minimum(increments, 1.0 - tf.squeeze(index, axis=-1))
         return index + tf.expand_dims(safe_increment, axis=-1)
 
     def _apply_attention_adjustment(self, index, gestures):
         attention_mask = tf.cast(tf.equal(gestures, 0), tf.int32)
 
-        def calculate_final_streak(mask):
-            reversed_mask = tf.reverse(mask, axis=[0])
-            streak = tf.argmax(tf.not_equal(reversed_mask, 0), output_type=tf.int32)
-            is_all = tf.reduce_all(tf.equal(mask, 0))
-            return tf.where(is_all, tf.shape(mask)[0], streak)
-
-        final_streaks = tf.map_fn(calculate_final_streak, attention_mask, fn_output_signature=tf.int32)
+        # Ojo: esto cuenta la racha final de pasos *sin* atención
+        # (o la secuencia completa si no hay ninguno con atención)
+        final_streaks = tf.reduce_sum(tf.math.cumprod(1 - tf.reverse(attention_mask, axis=[1]), axis=1), axis=1)
 
         def compute_reduction(streak_and_index):
             streak, idx = streak_and_index
@@ -377,8 +326,7 @@ class ExtremeValueAdjustment(tf.keras.layers.Layer):
             return reduction
 
         index_flat = tf.squeeze(index, axis=-1)
-        input_tuple = (final_streaks, index_flat)
-        reductions = tf.map_fn(compute_reduction, input_tuple, fn_output_signature=tf.float32)
+        reductions = compute_reduction((final_streaks, index_flat))
         safe_reduction = tf.maximum(reductions, -index_flat)
         return index + tf.expand_dims(safe_reduction, axis=-1)
 
@@ -0,0 +1,480 @@
+import json
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+
+# Códigos de gesto tal como los ve el modelo (orden del LabelEncoder)
+ATTENTION, EYESCLOSED, YAWNING = 0, 1, 2
+WINDOW = 240
+
+# Parámetros por defecto de cada capa (los mismos que en custom_layers/layers.py)
+DEFAULT_LAYER_CONFIG = {
+    'EyesClosedConsecutiveAdjustment': {
+        'initial_threshold': 5, 'saturation_point': 10, 'saturation_strength': 1.0, 'max_adjustment': 0.20
+    },
+    'YawningConsecutiveAdjustment': {
+        'min_streak_high_impact': 4, 'min_streak_low_impact': 7,
+        'min_streaks_high_activate': 2, 'min_streaks_low_activate': 3,
+        'high_impact_initial': 0.18, 'low_impact_initial': 0.05,
+        'max_adjustment': 0.35, 'high_decay_rate': 0.5, 'low_decay_rate': 0.5
+    },
+    'CombinedConsecutiveAdjustment': {
+        'eyesclosed_threshold': 40, 'attention_threshold': 40, 'max_adjustment': 0.05, 'saturation_point': 160
+    },
+    'AttentionConsecutiveAdjustment': {
+        'activation_threshold': 100, 'saturation_point': 160, 'max_reduction': 0.30
+    },
+}
+
+
+class DrowsinessParams:
+    """Pesos entrenados y configuración de las capas que forman el índice de somnolencia"""
+
+    def __init__(self, attention_weight, eyesclosed_weight, yawning_weight, layer_config=None):
+        self.attention_weight = np.float32(attention_weight)
+        self.eyesclosed_weight = np.float32(eyesclosed_weight)
+        self.yawning_weight = np.float32(yawning_weight)
+        self.layers = {name: dict(cfg) for name, cfg in DEFAULT_LAYER_CONFIG.items()}
+        for name, cfg in (layer_config or {}).items():
+            if name in self.layers:
+                self.layers[name].update({k: v for k, v in cfg.items() if k in self.layers[name]})
+
+    @classmethod
+    def from_keras_model(cls, model):
+        """Extrae los parámetros de un modelo Keras ya cargado (p. ej. Modelo_6_capas.h5)"""
+        weights, layer_config = {}, {}
+        for layer in model.layers:
+            name = type(layer).__name__
+            if name == 'DrowsinessIndexLayer':
+                weights = {w: float(getattr(layer, w).numpy()[0])
+                           for w in ('attention_weight', 'eyesclosed_weight', 'yawning_weight')}
+            elif name in DEFAULT_LAYER_CONFIG:
+                layer_config[name] = {k: getattr(layer, k) for k in DEFAULT_LAYER_CONFIG[name]}
+        if not weights:
+            raise ValueError("El modelo no contiene una DrowsinessIndexLayer")
+        return cls(layer_config=layer_config, **weights)
+
+    @classmethod
+    def from_h5(cls, path):
+        """Lee pesos y configuración directamente del .h5, sin cargar TensorFlow"""
+        import h5py
+
+        weights, layer_config = {}, {}
+        with h5py.File(path, "r") as f:
+            config = json.loads(f.attrs['model_config'])
+            for layer in config['config']['layers']:
+                if layer['class_name'] in DEFAULT_LAYER_CONFIG:
+                    layer_config[layer['class_name']] = layer['config']
+
+            def collect(name, obj):
+                leaf = name.rsplit('/', 1)[-1].split(':')[0]
+                if leaf in ('attention_weight', 'eyesclosed_weight', 'yawning_weight'):
+                    weights[leaf] = float(np.asarray(obj).reshape(-1)[0])
+
+            f['model_weights'].visititems(collect)
+        if len(weights) != 3:
+            raise ValueError(f"{path} no contiene los pesos de DrowsinessIndexLayer")
+        return cls(layer_config=layer_config, **weights)
+
+
+def _sigmoid(x):
+    return np.float32(1.0) / (np.float32(1.0) + np.exp(-x))
+
+
+def _clip(x, low, high):
+    # np.clip tiene un costo fijo alto con escalares; este camino se usa en cada frame
+    return np.minimum(np.maximum(x, low), high)
+
+
+def index_from_stats(stats, params, window=WINDOW):
+    """Evalúa en forma cerrada las seis capas del modelo a partir de estadísticas de la ventana.
+
+    Replica el comportamiento real de las capas (no el nombre de sus variables):
+    - EyesClosed/Combined/Attention usan max(cumsum(mask) * mask), que es el *total* de
+      ese gesto en la ventana, no la racha máxima.
+    - Combined cuenta los 'Attention' posteriores al último 'EyesClosed'.
+    - En ExtremeValueAdjustment la "racha final" de atención es en realidad la racha
+      final de gestos distintos de 'Attention' (o la ventana completa si no hay ninguno).
+
+    `stats` es un dict de arrays (o escalares) con las claves: attention, eyesclosed,
+    yawning, yawn_high, yawn_low, attention_after_eyesclosed, trailing_eyesclosed,
+    trailing_non_attention. Todo el cálculo es vectorizado.
+    """
+    f32 = np.float32
+    n = f32(window)
+    c0 = np.asarray(stats['attention'], dtype=f32)
+    c1 = np.asarray(stats['eyesclosed'], dtype=f32)
+    c2 = np.asarray(stats['yawning'], dtype=f32)
+
+    # DrowsinessIndexLayer
+    f0, f1, f2 = c0 / n, c1 / n, c2 / n
+    contribution = f0 * params.attention_weight + f1 * params.eyesclosed_weight + f2 * params.yawning_weight
+    index = _sigmoid(contribution * (f32(1.0) + _sigmoid(f0 * f32(2.0))))
+    index = _clip(index, f32(1e-7), f32(1.0 - 1e-7))
+
+    # EyesClosedConsecutiveAdjustment
+    cfg = params.layers['EyesClosedConsecutiveAdjustment']
+    safe_saturation = f32(max(1.0, cfg['saturation_point'] - cfg['initial_threshold']))
+    saturation = _sigmoid((c1 - f32(cfg['initial_threshold'])) / safe_saturation * f32(cfg['saturation_strength']))
+    adjustment = np.where(c1 >= cfg['initial_threshold'], f32(cfg['max_adjustment']) * saturation, f32(0.0))
+    index = _clip(index + adjustment, f32(0.0), f32(1.0))
+
+    # YawningConsecutiveAdjustment
+    cfg = params.layers['YawningConsecutiveAdjustment']
+    high = np.asarray(stats['yawn_high'], dtype=f32)
+    low = np.asarray(stats['yawn_low'], dtype=f32)
+    high_adjust = f32(cfg['high_impact_initial']) * np.exp(f32(-cfg['high_decay_rate']) * (high - f32(cfg['min_streaks_high_activate'])))
+    high_adjust = np.where(high >= cfg['min_streaks_high_activate'], high_adjust, f32(0.0))
+    low_adjust = f32(cfg['low_impact_initial']) * np.exp(f32(-cfg['low_decay_rate']) * (low - f32(cfg['min_streaks_low_activate'])))
+    low_adjust = np.where(low >= cfg['min_streaks_low_activate'], low_adjust, f32(0.0))
+    index = _clip(index + np.minimum(high_adjust + low_adjust, f32(cfg['max_adjustment'])), f32(0.0), f32(1.0))
+
+    # CombinedConsecutiveAdjustment
+    cfg = params.layers['CombinedConsecutiveAdjustment']
+    after = np.asarray(stats['attention_after_eyesclosed'], dtype=f32)
+    excess = np.maximum(after - f32(cfg['attention_threshold']), f32(0.0))
+    adjustment = f32(cfg['max_adjustment']) * (f32(1.0) - np.exp(-excess / f32(cfg['saturation_point'] / 3)))
+    active = (c1 >= cfg['eyesclosed_threshold']) & (after >= cfg['attention_threshold'])
+    adjustment = np.where(active, adjustment, f32(0.0))
+    index = np.maximum(np.minimum(index * (f32(1.0) - adjustment), f32(1.0)), f32(0.01))
+
+    # AttentionConsecutiveAdjustment
+    cfg = params.layers['AttentionConsecutiveAdjustment']
+    excess = np.maximum(c0 - f32(cfg['activation_threshold']), f32(0.0))
+    scale = np.log(f32(1.0) + excess / f32(cfg['saturation_point'] - cfg['activation_threshold'] + 1e-7))
+    reduction = f32(cfg['max_reduction']) * np.tanh(scale)
+    index = _clip(index * (f32(1.0) - reduction), f32(0.01), f32(1.0))
+
+    # ExtremeValueAdjustment: incremento por racha final de 'EyesClosed'
+    streak = np.asarray(stats['trailing_eyesclosed'], dtype=f32)
+    increment = np.zeros_like(streak)
+    increment = np.where((streak >= 1) & (streak <= 15), f32(0.002) + f32(0.028) * (streak - 1) / 14, increment)
+    increment = np.where((streak > 15) & (streak <= 40),
+                         f32(0.03) + f32(0.025) * np.sqrt(np.maximum(streak - 15, 0) / f32(25)), increment)
+    increment = np.where(streak > 40, f32(0.055) + f32(0.065 - 0.055) * (f32(1) - np.exp(f32(-0.05) * (streak - 40))), increment)
+    index = index + np.minimum(increment, f32(1.0) - index)
+
+    # ExtremeValueAdjustment: reducción por racha final (ver nota del docstring)
+    streak = np.asarray(stats['trailing_non_attention'], dtype=f32)
+    reduction = np.zeros_like(streak)
+    reduction = np.where((streak >= 120) & (streak <= 160), f32(-0.015) - f32(0.03) * (streak - 120) / 40, reduction)
+    reduction = np.where((streak > 160) & (streak < 240), f32(-0.045) - f32(0.055) * (streak - 160) / 79, reduction)
+    reduction = np.where(streak == 240, -index, reduction)
+    index = index + np.maximum(reduction, -index)
+
+    return _clip(index, f32(0.0), f32(1.0))
+
+
+class StreamingDrowsinessEvaluator:
+    """Mantiene en O(1) por gesto las estadísticas que necesita index_from_stats().
+
+    La ventana se guarda como rachas (gesto, longitud): al entrar un gesto se alarga o
+    abre la última racha y al salir el más antiguo se acorta la primera.
+    """
+
+    def __init__(self, params, window=WINDOW, initial=None):
+        self.params = params
+        self.window = window
+        self.reset(initial)
+
+    def reset(self, codes=None):
+        """Reinicia la ventana (por defecto, `window` pasos de 'Attention')"""
+        codes = [] if codes is None else [int(c) for c in codes][-self.window:]
+        codes = [ATTENTION] * (self.window - len(codes)) + codes
+        self._runs = deque()
+        self._length = 0
+        self.counts = [0, 0, 0]
+        self.yawn_high = 0
+        self.yawn_low = 0
+        self.attention_after_eyesclosed = 0
+        self.since_attention = 0
+        for code in codes:
+            self.push(code)
+
+    def push(self, code):
+        """Agrega el gesto más reciente y descarta el más antiguo si la ventana está llena"""
+        code = int(code)
+        if self._length == self.window:
+            self._pop_oldest()
+        if self._runs and self._runs[-1][0] == code:
+            self._runs[-1][1] += 1
+        else:
+            self._runs.append([code, 1])
+        self._length += 1
+        self.counts[code] += 1
+
+        if code == YAWNING:
+            self._yawn_run_changed(self._runs[-1][1] - 1, self._runs[-1][1])
+        if code == EYESCLOSED:
+            self.attention_after_eyesclosed = 0
+        elif code == ATTENTION:
+            self.attention_after_eyesclosed += 1
+        self.since_attention = 0 if code == ATTENTION else self.since_attention + 1
+
+    def set_params(self, params):
+        """Cambia los parámetros (otro modelo del índice) conservando la ventana actual"""
+        self.params = params
+        # Sólo las rachas de bostezo dependen de los umbrales; el resto de estadísticas no cambia
+        cfg = params.layers['YawningConsecutiveAdjustment']
+        yawn_runs = [length for code, length in self._runs if code == YAWNING]
+        self.yawn_high = sum(length >= cfg['min_streak_high_impact'] for length in yawn_runs)
+        self.yawn_low = sum(length >= cfg['min_streak_low_impact'] for length in yawn_runs)
+
+    def _pop_oldest(self):
+        run = self._runs[0]
+        run[1] -= 1
+        if run[0] == YAWNING:
+            self._yawn_run_changed(run[1] + 1, run[1])
+        if run[1] == 0:
+            self._runs.popleft()
+        self._length -= 1
+        self.counts[run[0]] -= 1
+
+    def _yawn_run_changed(self, old, new):
+        cfg = self.params.layers['YawningConsecutiveAdjustment']
+        for threshold, attr in ((cfg['min_streak_high_impact'], 'yawn_high'), (cfg['min_streak_low_impact'], 'yawn_low')):
+            if old < threshold <= new:
+                setattr(self, attr, getattr(self, attr) + 1)
+            elif new < threshold <= old:
+                setattr(self, attr, getattr(self, attr) - 1)
+
+    def stats(self):
+        last_code, last_length = self._runs[-1]
+        return {
+            'attention': self.counts[ATTENTION],
+            'eyesclosed': self.counts[EYESCLOSED],
+            'yawning': self.counts[YAWNING],
+            'yawn_high': self.yawn_high,
+            'yawn_low': self.yawn_low,
+            'attention_after_eyesclosed': self.attention_after_eyesclosed,
+            'trailing_eyesclosed': last_length if last_code == EYESCLOSED else 0,
+            'trailing_non_attention': self.window if self.counts[ATTENTION] == 0 else self.since_attention,
+        }
+
+    def index(self):
+        """Índice de somnolencia de la ventana actual, en [0, 1]"""
+        return float(index_from_stats(self.stats(), self.params, self.window))
+
+
+def _trailing_run(mask):
+    """Longitud de la racha final de True en cada fila (la fila completa si todas lo son)"""
+    reversed_mask = mask[:, ::-1]
+    return np.where(reversed_mask.all(axis=1), mask.shape[1], np.argmin(reversed_mask, axis=1))
+
+
+def window_stats(windows, high_impact=4, low_impact=7):
+    """Estadísticas de index_from_stats() para un lote de ventanas codificadas (N, window)"""
+    windows = np.asarray(windows)
+    if windows.ndim == 3:
+        windows = windows[..., 0]
+    windows = windows.astype(np.int8, copy=False)
+    count, length = windows.shape
+    attention = windows == ATTENTION
+    eyesclosed = windows == EYESCLOSED
+    yawning = windows == YAWNING
+
+    # Rachas de bostezo: inicios y finales emparejados en orden fila a fila
+    padded = np.zeros((count, length + 2), dtype=np.int8)
+    padded[:, 1:-1] = yawning
+    edges = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    run_lengths = end_cols - start_cols
+
+    # 'Attention' posteriores al último 'EyesClosed' = total menos los acumulados hasta él
+    last_eyesclosed = length - 1 - np.argmax(eyesclosed[:, ::-1], axis=1)
+    attention_cumsum = np.cumsum(attention, axis=1)
+    attention_total = attention_cumsum[:, -1]
+    attention_after = attention_total - attention_cumsum[np.arange(count), last_eyesclosed]
+
+    return {
+        'attention': attention_total,
+        'eyesclosed': eyesclosed.sum(axis=1),
+        'yawning': yawning.sum(axis=1),
+        'yawn_high': np.bincount(start_rows[run_lengths >= high_impact], minlength=count),
+        'yawn_low': np.bincount(start_rows[run_lengths >= low_impact], minlength=count),
+        'attention_after_eyesclosed': np.where(eyesclosed.any(axis=1), attention_after, 0),
+        'trailing_eyesclosed': _trailing_run(eyesclosed),
+        'trailing_non_attention': _trailing_run(~attention),
+    }
+
+
+def _prefix_sum(mask):
+    """Conteos acumulados con un cero inicial: los pasos [a, b) suman prefix[b] - prefix[a]"""
+    prefix = np.zeros(mask.size + 1, dtype=np.int64)
+    np.cumsum(mask, out=prefix[1:])
+    return prefix
+
+
+def _run_starts(mask):
+    """Posición donde empieza la racha de True que contiene cada paso (sin sentido donde mask es False)"""
+    starts = mask.copy()
+    starts[1:] &= ~mask[:-1]
+    return np.maximum.accumulate(np.where(starts, np.arange(mask.size), 0))
+
+
+def _run_ends(mask):
+    """Posición donde termina (inclusive) la racha de True que contiene cada paso"""
+    return mask.size - 1 - _run_starts(mask[::-1])[::-1]
+
+
+def sequence_window_stats(codes, window=WINDOW, high_impact=4, low_impact=7):
+    """Estadísticas de window_stats() para cada ventana deslizante completa de una secuencia.
+
+    Devuelve len(codes) - window + 1 valores por estadística sin construir las ventanas:
+    los conteos son diferencias de sumas acumuladas y las rachas salen de la posición de
+    inicio/fin de la racha que contiene cada paso, recortada a los bordes de la ventana.
+    Tiempo y memoria son O(len(codes)), independientes de `window`.
+    """
+    codes = np.asarray(codes).reshape(-1)
+    size = codes.size
+    count = size - window + 1
+    if count <= 0:
+        raise ValueError(f"La secuencia tiene {size} pasos, menos que una ventana de {window}")
+    attention = codes == ATTENTION
+    eyesclosed = codes == EYESCLOSED
+    yawning = codes == YAWNING
+    ends = np.arange(window - 1, size)  # último paso de cada ventana
+    firsts = ends - window + 1  # primer paso de cada ventana
+
+    # Conteos por ventana: diferencias de sumas acumuladas
+    attention_prefix = _prefix_sum(attention)
+    stats = {'attention': attention_prefix[window:] - attention_prefix[:count]}
+    for name, mask in (('eyesclosed', eyesclosed), ('yawning', yawning)):
+        prefix = _prefix_sum(mask)
+        stats[name] = prefix[window:] - prefix[:count]
+
+    # 'Attention' posteriores al último 'EyesClosed' de la ventana (0 si no hay ninguno)
+    last_eyesclosed = np.maximum.accumulate(np.where(eyesclosed, np.arange(size), -1))[ends]
+    after = attention_prefix[ends + 1] - attention_prefix[last_eyesclosed + 1]
+    stats['attention_after_eyesclosed'] = np.where(last_eyesclosed >= firsts, after, 0)
+
+    # Rachas finales, recortadas al largo de la ventana
+    for name, mask in (('trailing_eyesclosed', eyesclosed), ('trailing_non_attention', ~attention)):
+        run = np.minimum(ends - _run_starts(mask)[ends] + 1, window)
+        stats[name] = np.where(mask[ends], run, 0)
+
+    # Rachas de bostezo de al menos `threshold` pasos dentro de cada ventana: las que
+    # terminan en la ventana más las recortadas por sus bordes
+    run_starts, run_ends = _run_starts(yawning), _run_ends(yawning)
+    run_lengths = run_ends - run_starts + 1
+    last_step = np.zeros(size, dtype=bool)
+    last_step[run_ends[yawning]] = True
+    left_cut = yawning[firsts] & (run_starts[firsts] < firsts)  # racha que entra por el borde izquierdo
+    left_end = run_ends[firsts]
+    right_cut = yawning[ends] & (run_ends[ends] > ends) & (run_starts[ends] >= firsts)
+    for name, threshold in (('yawn_high', high_impact), ('yawn_low', low_impact)):
+        ending = _prefix_sum(last_step & (run_lengths >= threshold))
+        total = ending[ends + 1] - ending[firsts]
+        # La racha del borde izquierdo cuenta sólo por la parte que queda dentro
+        total -= left_cut & (left_end <= ends) & (run_lengths[firsts] >= threshold)
+        total += left_cut & (np.minimum(left_end, ends) - firsts + 1 >= threshold)
+        total += right_cut & (ends - run_starts[ends] + 1 >= threshold)
+        stats[name] = total
+    return stats
+
+
+class NumpyDrowsinessModel:
+    """Motor de inferencia del índice en NumPy puro, equivalente a la salida 0 del modelo Keras"""
+
+    def __init__(self, params, window=WINDOW):
+        self.params = params
+        self.window = window
+
+    @classmethod
+    def from_h5(cls, path, window=WINDOW):
+        return cls(DrowsinessParams.from_h5(path), window=window)
+
+    def predict(self, windows):
+        """Índices (N,) para un lote de ventanas codificadas de forma (N, window) o (N, window, 1)"""
+        cfg = self.params.layers['YawningConsecutiveAdjustment']
+        stats = window_stats(windows, cfg['min_streak_high_impact'], cfg['min_streak_low_impact'])
+        return index_from_stats(stats, self.params, self.window)
+
+    def index(self, window):
+        """Índice de una sola ventana"""
+        return float(self.predict(np.asarray(window).reshape(1, -1))[0])
+
+    def iter_sequence(self, codes, initial=None, chunk_size=1 << 18):
+        """Índices de todas las ventanas deslizantes de `codes`, en bloques de hasta `chunk_size`.
+
+        Sin `initial` hay una ventana por cada posición completa (len(codes) - window + 1).
+        Con `initial` la secuencia se antepone de window - 1 pasos de ese gesto, como una
+        sesión nueva del servidor, y hay un índice tras cada gesto. Cada bloque sólo lee
+        chunk_size + window - 1 pasos, así que `codes` puede ser un np.memmap de cualquier largo.
+        """
+        cfg = self.params.layers['YawningConsecutiveAdjustment']
+        padding = 0 if initial is None else self.window - 1
+        total = len(codes) + padding - self.window + 1
+        for first in range(0, max(total, 0), chunk_size):
+            stop = min(first + chunk_size, total) + self.window - 1  # en coordenadas con relleno
+            block = np.asarray(codes[max(first - padding, 0):stop - padding], dtype=np.uint8)
+            if first < padding:
+                block = np.concatenate((np.full(padding - first, initial, dtype=np.uint8), block))
+            stats = sequence_window_stats(block, self.window, cfg['min_streak_high_impact'],
+                                          cfg['min_streak_low_impact'])
+            yield index_from_stats(stats, self.params, self.window)
+
+    def score_sequence(self, codes, initial=None, chunk_size=1 << 18):
+        """Como iter_sequence(), pero devuelve todos los índices en un solo array float32"""
+        padding = 0 if initial is None else self.window - 1
+        scores = np.empty(max(len(codes) + padding - self.window + 1, 0), dtype=np.float32)
+        position = 0
+        for block in self.iter_sequence(codes, initial, chunk_size):
+            scores[position:position + len(block)] = block
+            position += len(block)
+        return scores
+
+
+def pack_window(window):
+    """Empaqueta una ventana de códigos 0-2 a 2 bits por paso (240 pasos -> 60 bytes)"""
+    codes = np.asarray(window, dtype=np.uint8).reshape(-1)
+    if codes.size % 4:
+        codes = np.concatenate((codes, np.zeros(4 - codes.size % 4, dtype=np.uint8)))
+    quads = codes.reshape(-1, 4)
+    return (quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)).tobytes()
+
+
+class IndexCache:
+    """Caché LRU acotada del índice por ventana, compartida entre sesiones.
+
+    Muchas sesiones pasan largos periodos con la misma ventana (240 x Attention, o la
+    ventana por defecto que devuelve synchronized_excel_access tras un fallo), así que
+    el índice se guarda con la ventana empaquetada a 2 bits como clave.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counts = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get_or_compute(self, window, compute):
+        """Índice de la ventana desde la caché, o compute(window) si no está"""
+        key = pack_window(window)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._counts['hits'] += 1
+                return value
+            self._counts['misses'] += 1
+
+        # Se calcula fuera del lock; si dos hilos calculan la misma ventana el resultado es igual
+        value = compute(window)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self._counts['evictions'] += 1
+        return value
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['capacity'] = self.capacity
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,119 @@
+import threading
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = (16, 16)
+
+
+def box_thumbnail(frame, box, size=THUMBNAIL_SIZE):
+    """Miniatura en gris (float32) del recorte de la caja, usada para validarla; None si está vacía"""
+    x1, y1, x2, y2 = box
+    roi = frame[y1:y2, x1:x2]
+    if roi.size == 0:
+        return None
+    small = cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+class TrackerMetrics:
+    """Contadores compartidos por todos los trackers: detecciones evitadas y auditorías"""
+
+    def __init__(self, audit_every=50):
+        self.audit_every = audit_every
+        self._lock = threading.Lock()
+        self._counts = {'frames': 0, 'detections': 0, 'reused': 0, 'validation_failed': 0,
+                        'audits': 0, 'audit_disagreements': 0}
+        self._audit_prob_diff = 0.0
+        self._audits_due = 0  # Auditorías ganadas y todavía no reclamadas con audit_due()
+
+    def record(self, name):
+        with self._lock:
+            self._counts[name] += 1
+            if name in ('detections', 'reused'):
+                self._counts['frames'] += 1
+            # El múltiplo se cuenta bajo el mismo lock que el incremento: cada uno da una sola auditoría
+            if name == 'reused' and self.audit_every and self._counts['reused'] % self.audit_every == 0:
+                self._audits_due += 1
+
+    def audit_due(self):
+        """True una vez por cada `audit_every` cajas reutilizadas en todas las sesiones (0 desactiva la auditoría)"""
+        with self._lock:
+            if self._audits_due:
+                self._audits_due -= 1
+                return True
+            return False
+
+    def record_audit(self, agrees, prob_diff):
+        with self._lock:
+            self._counts['audits'] += 1
+            if not agrees:
+                self._counts['audit_disagreements'] += 1
+            self._audit_prob_diff += prob_diff
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counts)
+            prob_diff = self._audit_prob_diff
+        stats['skip_ratio'] = stats['reused'] / stats['frames'] if stats['frames'] else 0.0
+        if stats['audits']:
+            stats['audit_agreement'] = 1.0 - stats['audit_disagreements'] / stats['audits']
+            stats['audit_mean_abs_prob_diff'] = prob_diff / stats['audits']
+        return stats
+
+
+class FaceBoxTracker:
+    """Reutiliza la caja del rostro de una sesión entre frames y sólo re-detecta cuando hace falta.
+
+    La cabeza del conductor apenas se mueve entre frames, así que la caja ampliada de la
+    última detección se reutiliza mientras la miniatura de su recorte se parezca a la
+    tomada al detectar (diferencia media <= `max_diff` niveles de gris). Se vuelve a
+    detectar cada `redetect_interval` frames, si la validación falla o si la última
+    detección tuvo una confianza menor que `min_confidence`.
+    """
+
+    def __init__(self, redetect_interval=5, max_diff=20.0, min_confidence=0.7, metrics=None):
+        self.redetect_interval = redetect_interval
+        self.max_diff = max_diff
+        self.min_confidence = min_confidence
+        self.metrics = metrics or TrackerMetrics(audit_every=0)
+        self._lock = threading.Lock()
+        self._box = None
+        self._reference = None
+        self._confidence = 0.0
+        self._since_detection = 0
+
+    def locate(self, frame, detect):
+        """Caja del rostro en el frame y si hizo falta detectarla: (caja o None, detectado).
+
+        `detect(frame)` es la detección completa y devuelve (caja, score) como preprocessing.detect_face.
+        """
+        with self._lock:
+            if self._can_reuse(frame):
+                self._since_detection += 1
+                self.metrics.record('reused')
+                return self._box, False
+
+            box, score = detect(frame)
+            self.metrics.record('detections')
+            self._box = box
+            self._confidence = score
+            self._reference = box_thumbnail(frame, box) if box is not None else None
+            self._since_detection = 0
+            return box, True
+
+    def _can_reuse(self, frame):
+        if self._box is None or self._reference is None:
+            return False
+        if self._since_detection + 1 >= self.redetect_interval or self._confidence < self.min_confidence:
+            return False
+        thumbnail = box_thumbnail(frame, self._box)
+        if (thumbnail is None or thumbnail.shape != self._reference.shape
+                or float(np.mean(np.abs(thumbnail - self._reference))) > self.max_diff):
+            self.metrics.record('validation_failed')
+            return False
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._box = None
+            self._reference = None
@@ -0,0 +1,151 @@
+"""Diario binario de gestos por sesión, de solo-añadido, con lectura por memory-map.
+
+Cada sesión escribe en su propio archivo una cabecera de 8 bytes seguida de registros de
+tamaño fijo: instante (segundos Unix, float64) y código del gesto (1 byte, el mismo de la
+ventana del modelo). El lector mapea el archivo con np.memmap, así que horas de una sesión
+se recorren sin convertirlas en objetos de Python.
+
+Uso (repetición de una sesión a través del índice):
+    python gesture_log.py logs/gestures_1a2b3c4d5e6f.vlog [--output indices.csv]
+"""
+import argparse
+import os
+import struct
+import sys
+import threading
+import time
+import numpy as np
+from drowsiness_engine import ATTENTION, NumpyDrowsinessModel
+from gesture_store import session_file
+
+LOG_MAGIC = b"VIGLOG01"
+RECORD = struct.Struct("<dB")
+RECORD_DTYPE = np.dtype([('timestamp', '<f8'), ('gesture', 'u1')])
+
+
+def log_path(directory, token):
+    """Ruta del diario de una sesión; como en las instantáneas, el token no se escribe en claro"""
+    return session_file(os.path.join(directory, "gestures.vlog"), token)
+
+
+class GestureLogWriter:
+    """Añade los gestos de cada sesión a su diario desde un hilo en segundo plano.
+
+    append() sólo agrega 9 bytes a un buffer en memoria; cada `flush_interval` segundos el
+    hilo escribe los buffers acumulados con una llamada por archivo. Con `fsync` además se
+    fuerza el volcado a disco en cada escritura.
+    """
+
+    def __init__(self, directory, flush_interval=0.5, fsync=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._pending = {}  # ruta -> bytearray con registros sin escribir
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {'appended': 0, 'written': 0, 'flushes': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name="gesture-log", daemon=True)
+        self._thread.start()
+
+    def append(self, token, code, timestamp=None):
+        """Programa un registro sin bloquear al llamador"""
+        record = RECORD.pack(time.time() if timestamp is None else timestamp, code)
+        path = log_path(self.directory, token)
+        with self._lock:
+            buffer = self._pending.get(path)
+            if buffer is None:
+                buffer = self._pending[path] = bytearray()
+            buffer += record
+            self._stats['appended'] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Escribe ya los registros pendientes"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for path, records in pending.items():
+                try:
+                    self._write(path, records)
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    print(f"Error escribiendo el diario de gestos {path}: {e}")
+                    continue
+                self._stats['written'] += len(records) // RECORD.size
+            self._stats['flushes'] += 1
+
+    def _write(self, path, records):
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(LOG_MAGIC)
+            f.write(records)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self, timeout=None):
+        """Escribe los registros pendientes y detiene el hilo"""
+        self._stop.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = sum(len(records) for records in self._pending.values()) // RECORD.size
+        return stats
+
+
+def open_log(path):
+    """Registros del diario como np.memmap de solo lectura (campos 'timestamp' y 'gesture').
+
+    Un registro a medio escribir al final (p. ej. tras una caída) se ignora.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f"{path} no es un diario de gestos")
+    count = (os.path.getsize(path) - len(LOG_MAGIC)) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=len(LOG_MAGIC), shape=(count,))
+
+
+def replay_log(path, model, chunk_size=1 << 18):
+    """(instantes, índices 0-1 tras cada gesto) de un diario, evaluado por bloques con model.score_sequence().
+
+    Igual que una sesión nueva en el servidor, la ventana empieza llena de 'Attention'.
+    """
+    records = open_log(path)
+    return records['timestamp'], model.score_sequence(records['gesture'], initial=ATTENTION, chunk_size=chunk_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="Diario de gestos (.vlog)")
+    parser.add_argument("--model", default="./models/Modelo_6_capas.h5", help="Modelo del índice (.h5)")
+    parser.add_argument("--output", default=None, help="CSV con timestamp, gesto e índice por registro")
+    args = parser.parse_args()
+
+    engine = NumpyDrowsinessModel.from_h5(args.model)
+    start = time.perf_counter()
+    timestamps, indices = replay_log(args.log, engine)
+    elapsed = time.perf_counter() - start
+    if not len(indices):
+        print(f"{args.log} no tiene registros")
+        sys.exit(0)
+
+    duration = float(timestamps[-1] - timestamps[0])
+    print(f"{len(indices)} gestos en {duration / 60:.1f} min de sesión, repetidos en {elapsed:.2f} s "
+          f"({len(indices) / elapsed:,.0f} gestos/s)")
+    print(f"Índice máximo {indices.max() * 100:.0f}, medio {indices.mean() * 100:.1f}")
+    if args.output:
+        gestures = open_log(args.log)['gesture']
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("timestamp,gesture,drowsiness_index\n")
+            f.writelines(f"{t:.3f},{g},{round(i * 100)}\n" for t, g, i in zip(timestamps, gestures, indices))
+        print(f"Índices guardados en {args.output}")
@@ -0,0 +1,260 @@
+import os
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Orden de clases idéntico al LabelEncoder del entrenamiento (orden alfabético)
+DEFAULT_CLASSES = ['Attention', 'EyesClosed', 'Yawning']
+
+
+class GestureRingBuffer:
+    """Guarda los últimos `size` gestos codificados en un buffer circular de enteros.
+
+    Si se pasa un `evaluator` (p. ej. StreamingDrowsinessEvaluator) se le notifica cada
+    gesto bajo el mismo lock, de modo que sus estadísticas siempre coinciden con la ventana.
+    """
+
+    def __init__(self, size=240, classes=DEFAULT_CLASSES, default_gesture='Attention', evaluator=None):
+        self.size = size
+        self.classes = list(classes)
+        self._codes = {name: code for code, name in enumerate(self.classes)}
+        self._default_code = self._codes[default_gesture]
+        self._buffer = np.full(size, self._default_code, dtype=np.uint8)
+        self._head = 0  # Posición del gesto más antiguo
+        self._lock = threading.Lock()
+        self.evaluator = evaluator
+        if evaluator is not None:
+            evaluator.reset(self._buffer)
+
+    def encode(self, gesture):
+        """Devuelve el código del gesto, usando el gesto por defecto si no es válido"""
+        return self._codes.get(gesture, self._default_code)
+
+    def append(self, gesture):
+        """Agrega un gesto descartando el más antiguo"""
+        code = self.encode(gesture)
+        with self._lock:
+            self._buffer[self._head] = code
+            self._head = (self._head + 1) % self.size
+            if self.evaluator is not None:
+                self.evaluator.push(code)
+
+    def load(self, gestures):
+        """Reemplaza el contenido con una secuencia (rellena con el gesto por defecto al inicio)"""
+        codes = [self.encode(g) for g in list(gestures)[-self.size:]]
+        with self._lock:
+            self._buffer[:] = self._default_code
+            if codes:
+                self._buffer[-len(codes):] = codes
+            self._head = 0
+            if self.evaluator is not None:
+                self.evaluator.reset(self._buffer)
+
+    def window(self):
+        """Copia de la ventana codificada, del gesto más antiguo al más reciente"""
+        with self._lock:
+            return np.concatenate((self._buffer[self._head:], self._buffer[:self._head]))
+
+    def drowsiness_index(self, cache=None):
+        """Índice de somnolencia calculado incrementalmente por el evaluador asociado.
+
+        Con `cache` (drowsiness_engine.IndexCache) se consulta antes con la ventana actual como clave.
+        """
+        with self._lock:
+            if cache is None:
+                return self.evaluator.index()
+            window = np.concatenate((self._buffer[self._head:], self._buffer[:self._head]))
+            return cache.get_or_compute(window, lambda _: self.evaluator.index())
+
+    def set_evaluator_params(self, params):
+        """Cambia los parámetros del evaluador bajo el lock del buffer"""
+        with self._lock:
+            self.evaluator.set_params(params)
+
+    def gestures(self):
+        """Ventana decodificada como lista de nombres de gestos"""
+        return [self.classes[code] for code in self.window()]
+
+
+class SessionStore:
+    """Secuencias de gestos independientes por sesión (token), con expulsión por TTL/LRU.
+
+    Las sesiones se reparten en shards con su propio lock, así que dos conductores
+    sólo compiten entre sí si caen en el mismo shard. El límite LRU se aplica por shard:
+    cada uno admite max_sessions / num_shards sesiones más un 25% de holgura, porque los
+    tokens no se reparten de forma exacta. Un shard más cargado que eso expulsa sesiones
+    activas antes de llegar a max_sessions en total, y con todos los shards llenos el total
+    puede superar max_sessions hasta en ese 25%.
+    """
+
+    SHARD_HEADROOM = 1.25
+
+    def __init__(self, factory, num_shards=16, ttl=900.0, max_sessions=10000):
+        self._factory = factory
+        self.ttl = ttl
+        self._shard_capacity = max(1, math.ceil(max_sessions / num_shards * self.SHARD_HEADROOM))
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(num_shards)]
+        self._evictions = [0] * num_shards  # Por shard, actualizado bajo el lock de ese shard
+
+    @property
+    def evictions(self):
+        return sum(self._evictions)
+
+    def _shard_index(self, token):
+        return hash(token) % len(self._shards)
+
+    def _shard(self, token):
+        return self._shards[self._shard_index(token)]
+
+    def get(self, token):
+        """Devuelve el buffer de la sesión, creándolo si no existe"""
+        now = time.monotonic()
+        index = self._shard_index(token)
+        lock, sessions = self._shards[index]
+        with lock:
+            entry = sessions.get(token)
+            if entry is None:
+                entry = sessions[token] = [self._factory(token), now]
+            else:
+                entry[1] = now
+                sessions.move_to_end(token)
+            self._evict(index, now)
+            return entry[0]
+
+    def _evict(self, index, now):
+        sessions = self._shards[index][1]
+        # El OrderedDict está en orden LRU: las sesiones caducadas están al principio
+        while sessions:
+            token, (_, last_seen) = next(iter(sessions.items()))
+            if now - last_seen <= self.ttl and len(sessions) <= self._shard_capacity:
+                break
+            del sessions[token]
+            self._evictions[index] += 1
+
+    def evict_expired(self):
+        """Recorre todos los shards eliminando las sesiones inactivas"""
+        now = time.monotonic()
+        for index, (lock, _) in enumerate(self._shards):
+            with lock:
+                self._evict(index, now)
+
+    def discard(self, token):
+        lock, sessions = self._shard(token)
+        with lock:
+            sessions.pop(token, None)
+
+    def __len__(self):
+        return sum(len(sessions) for _, sessions in self._shards)
+
+
+class SessionSweeper:
+    """Llama a evict_expired() de varios SessionStore cada `interval` segundos en segundo plano.
+
+    Sin él, una sesión inactiva sólo caduca cuando otro token cae en su mismo shard.
+    """
+
+    def __init__(self, stores, interval=60.0):
+        self.stores = list(stores)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for store in self.stores:
+                try:
+                    store.evict_expired()
+                except Exception as e:
+                    print(f"Error expulsando sesiones inactivas: {e}")
+
+    def close(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+def session_file(base_path, token):
+    """Ruta de exportación de una sesión; el token nunca se escribe en claro en disco"""
+    if not token:
+        return base_path
+    root, ext = os.path.splitext(base_path)
+    return f"{root}_{session_key(token)}{ext}"
+
+
+def session_key(token):
+    """Identificador no secreto de una sesión (prefijo del SHA-1 del token), para archivos y enrutamiento"""
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()[:12]
+
+
+class SnapshotExporter:
+    """Exporta instantáneas de la secuencia a Excel/CSV en un hilo en segundo plano.
+
+    Sólo se conserva la instantánea más reciente: si el disco va más lento que las
+    peticiones, las intermedias se descartan en lugar de acumularse.
+    """
+
+    def __init__(self, fmt='xlsx', interval=1.0):
+        if fmt not in ('xlsx', 'csv'):
+            raise ValueError(f"Formato de exportación no soportado: {fmt}")
+        self.fmt = fmt
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="gesture-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, gestures):
+        """Programa la escritura de una secuencia de gestos sin bloquear al llamador"""
+        with self._lock:
+            self._pending[path] = list(gestures)
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for path, gestures in pending.items():
+                try:
+                    self._write(path, gestures)
+                except Exception as e:
+                    print(f"Error exportando la secuencia de gestos: {e}")
+            if self._stopping:
+                return
+            time.sleep(self.interval)
+
+    def close(self, timeout=None):
+        """Escribe las instantáneas pendientes y detiene el hilo"""
+        self._stopping = True
+        self._event.set()
+        self._thread.join(timeout)
+
+    def _write(self, path, gestures):
+        steps = range(1, len(gestures) + 1)
+        tmp_path = f"{path}.tmp"
+        if self.fmt == 'csv':
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("Step,Gesture\n")
+                f.writelines(f"{step},{gesture}\n" for step, gesture in zip(steps, gestures))
+        else:
+            import pandas as pd
+            pd.DataFrame({'Step': steps, 'Gesture': gestures}).to_excel(tmp_path, index=False, engine='openpyxl')
+        # Reemplazo atómico para que un lector nunca vea el archivo a medio escribir
+        os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """Lee la columna 'Gesture' de una instantánea previa (Excel o CSV)"""
+    if path.endswith('.csv'):
+        with open(path, encoding="utf-8") as f:
+            next(f, None)
+            return [line.rstrip("\n").split(",", 1)[1] for line in f if "," in line]
+    import pandas as pd
+    df = pd.read_excel(path)
+    return df['Gesture'].dropna().tolist()
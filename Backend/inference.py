@@ -0,0 +1,233 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+class BatchingScheduler:
+    """Agrupa las entradas de peticiones concurrentes en un solo lote para el modelo.
+
+    El lote se envía al llegar a `max_batch_size` elementos o cuando el más antiguo
+    lleva `max_wait_ms` esperando; cada petición recibe sólo su fila del resultado.
+    Si el proceso se bifurca (workers de serve.py) el hijo arranca su propio hilo.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, name="cnn-batcher"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        # El pid se publica al final: quien lo vea actualizado ya encuentra la cola nueva
+        self._pid = os.getpid()
+
+    def submit(self, inputs):
+        """Encola una entrada de forma (1, ...) y devuelve un Future con su predicción"""
+        if self._closed:
+            raise RuntimeError("El planificador de inferencia está cerrado")
+        if self._pid != os.getpid():
+            # Varios hilos del worker recién bifurcado pueden llegar a la vez: sólo uno arranca
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+        future = Future()
+        self._queue.put((inputs, future))
+        return future
+
+    def predict(self, inputs, timeout=None):
+        """Versión bloqueante de submit()"""
+        return self.submit(inputs).result(timeout=timeout)
+
+    def close(self):
+        self._closed = True
+        if self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Se procesa el lote actual y luego se termina
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            futures = [future for _, future in batch]
+            try:
+                inputs = np.concatenate([np.asarray(x, dtype=np.float32) for x, _ in batch], axis=0)
+                outputs = self.predict_fn(inputs)
+                for i, future in enumerate(futures):
+                    future.set_result(outputs[i])
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class CompiledModel:
+    """Modelo Keras compilado una sola vez como tf.function con firma de entrada fija.
+
+    Evita el adaptador de datos y el despacho que Model.predict reconstruye en cada
+    llamada. Expone predict() con la misma forma de salida para poder reemplazarlo.
+    """
+
+    def __init__(self, model, input_shape, jit_compile=False, warmup=True, name=None):
+        import tensorflow as tf
+
+        self.model = model
+        self.name = name or model.name
+        self.input_shape = tuple(input_shape)
+        self.jit_compile = jit_compile
+        self._tf = tf
+        self._fn = self._build(jit_compile)
+        if warmup:
+            self.warmup()
+
+    def _build(self, jit_compile):
+        tf = self._tf
+        signature = [tf.TensorSpec(shape=self.input_shape, dtype=tf.float32)]
+        return tf.function(lambda x: self.model(x, training=False),
+                           input_signature=signature, jit_compile=jit_compile)
+
+    def __call__(self, inputs):
+        outputs = self._fn(self._tf.convert_to_tensor(np.asarray(inputs, dtype=np.float32)))
+        if isinstance(outputs, (list, tuple)):
+            return [output.numpy() for output in outputs]
+        return outputs.numpy()
+
+    def predict(self, inputs, verbose=0):
+        return self(inputs)
+
+    def warmup(self, batch_sizes=(1,)):
+        """Traza el grafo (y lo compila con XLA si se pidió) antes de recibir tráfico"""
+        for batch_size in batch_sizes:
+            sample = np.zeros((batch_size,) + self.input_shape[1:], dtype=np.float32)
+            try:
+                self(sample)
+            except Exception as e:
+                if not self.jit_compile:
+                    raise
+                # Algunas operaciones (p. ej. segmentos de tamaño dinámico) no compilan con XLA
+                print(f"⚠️ XLA no disponible para {self.name}, se usa tf.function sin XLA: {str(e).splitlines()[0]}")
+                self.jit_compile = False
+                self._fn = self._build(False)
+                self(sample)
+
+
+class TFLiteModel:
+    """Modelo TFLite (p. ej. la CNN cuantizada) con la misma interfaz que CompiledModel.
+
+    Usa tflite_runtime o ai_edge_litert si están instalados y, si no, el intérprete
+    incluido en TensorFlow.
+    El intérprete no es seguro entre hilos: está pensado para usarse detrás del
+    BatchingScheduler, que hace todas las llamadas desde un único hilo.
+    """
+
+    def __init__(self, path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from ai_edge_litert.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+
+        self.name = path
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+
+    def _prepare(self, batch_size):
+        if batch_size != self._batch_size:
+            shape = [batch_size] + list(self._input['shape'][1:])
+            self._interpreter.resize_tensor_input(self._input['index'], shape)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def __call__(self, inputs):
+        inputs = np.asarray(inputs, dtype=np.float32)
+        self._prepare(inputs.shape[0])
+        dtype = self._input['dtype']
+        if dtype != np.float32:
+            # Modelo de enteros completo: cuantizar la entrada con su escala y punto cero
+            scale, zero_point = self._input['quantization']
+            info = np.iinfo(dtype)
+            inputs = np.clip(np.round(inputs / scale + zero_point), info.min, info.max).astype(dtype)
+        self._interpreter.set_tensor(self._input['index'], inputs)
+        self._interpreter.invoke()
+        outputs = self._interpreter.get_tensor(self._output['index'])
+        if self._output['dtype'] != np.float32:
+            scale, zero_point = self._output['quantization']
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+    def predict(self, inputs, verbose=0):
+        return self(inputs)
+
+    def warmup(self, batch_sizes=(1,)):
+        for batch_size in batch_sizes:
+            self(np.zeros([batch_size] + list(self._input['shape'][1:]), dtype=np.float32))
+
+
+def compare_latency(model, compiled, inputs, repeats=50):
+    """Latencia media por llamada (ms) de model.predict frente al modelo compilado"""
+    def timed(fn):
+        fn(inputs)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn(inputs)
+        return (time.perf_counter() - start) / repeats * 1000
+
+    predict_ms = timed(lambda x: model.predict(x, verbose=0))
+    compiled_ms = timed(compiled)
+    return {'predict_ms': predict_ms, 'compiled_ms': compiled_ms, 'speedup': predict_ms / compiled_ms}
+
+
+if __name__ == "__main__":
+    import sys
+    import tensorflow as tf
+    from custom_layers import CUSTOM_OBJECTS
+
+    # Uso: python inference.py [--xla]
+    jit = "--xla" in sys.argv[1:]
+    models = [
+        (tf.keras.models.load_model("./models/2105.h5"), (None, 112, 112, 1)),
+        (tf.keras.models.load_model("./models/Modelo_6_capas.h5", custom_objects=CUSTOM_OBJECTS, compile=False),
+         (None, 240, 1)),
+    ]
+    for model, shape in models:
+        compiled = CompiledModel(model, shape, jit_compile=jit)
+        for batch_size in (1, 16):
+            sample = np.random.rand(batch_size, *shape[1:]).astype(np.float32)
+            stats = compare_latency(model, compiled, sample)
+            print(f"{compiled.name} (lote {batch_size}, xla={compiled.jit_compile}): "
+                  f"predict {stats['predict_ms']:.2f} ms, compilado {stats['compiled_ms']:.2f} ms "
+                  f"(x{stats['speedup']:.1f})")
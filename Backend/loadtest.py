@@ -0,0 +1,383 @@
+"""Generador de carga sintética: cuántos conductores simultáneos soporta un backend.
+
+Simula N clientes, cada uno con su propio token, que envían frames de un corpus local
+(carpeta de imágenes o video, como benchmark.py) cada 500 ms igual que el frontend: el
+envío no espera a la respuesta anterior. La concurrencia sube por etapas hasta que se
+rompe el SLO (p95 de latencia, tasa de errores o de frames descartados con 429) y se
+informa el máximo de sesiones sostenibles, el throughput y los percentiles de cada etapa.
+
+Modos:
+    image   POST /process-image con el JPEG (por defecto)
+    roi     POST /process-roi con la ROI gris de 112x112 (recorte central del frame)
+    stream  WebSocket /stream, una conexión por cliente
+
+La latencia se mide desde el instante programado de cada envío, así una cola del lado
+del cliente también cuenta. En /stream el servidor responde a cada frame en orden,
+también a los que descarta por llegar uno más reciente ({"dropped": "superseded"}), así
+que cada respuesta se asocia al frame pendiente más antiguo.
+
+Uso:
+    python loadtest.py frames/ --url http://localhost:5000 --start 2 --step 2 --max-clients 64
+    python loadtest.py video.mp4 --mode stream --slo-p95-ms 300 --output capacity.json
+"""
+import argparse
+import heapq
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import numpy as np
+import cv2
+from benchmark import git_revision, iter_jpeg_frames, summarize
+from gesture_store import session_key
+
+BOUNDARY = "vigil-loadtest-boundary"
+
+
+def multipart_body(jpeg):
+    """Cuerpo multipart/form-data con el campo 'image', como lo envía el frontend"""
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"frame.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + jpeg + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def raw_roi(jpeg, size=(112, 112)):
+    """ROI gris cruda del centro del frame, para /process-roi"""
+    frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_GRAYSCALE)
+    h, w = frame.shape
+    side = min(h, w)
+    crop = frame[(h - side) // 2:(h + side) // 2, (w - side) // 2:(w + side) // 2]
+    return cv2.resize(crop, size, interpolation=cv2.INTER_AREA).tobytes()
+
+
+class StageStats:
+    """Resultados de los frames enviados durante la ventana de medición de una etapa"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self.latencies_ms = []
+        self.counts = {'sent': 0, 'ok': 0, 'no_face': 0, 'dropped': 0, 'errors': 0}
+
+    def sent(self):
+        with self._lock:
+            self.counts['sent'] += 1
+
+    def record(self, outcome, latency_ms=None):
+        with self._lock:
+            self.counts[outcome] += 1
+            if outcome in ('ok', 'no_face'):
+                self.latencies_ms.append(latency_ms)
+            self._done.notify_all()
+
+    def pending(self):
+        return self.counts['sent'] - sum(v for k, v in self.counts.items() if k != 'sent')
+
+    def wait(self, timeout):
+        """Espera a que respondan los frames de la etapa; los que no lleguen cuentan como errores"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.pending() > 0 and time.monotonic() < deadline:
+                self._done.wait(deadline - time.monotonic())
+            self.counts['errors'] += self.pending()
+
+    def summary(self, clients, seconds, interval):
+        with self._lock:
+            counts = dict(self.counts)
+            latencies = list(self.latencies_ms)
+        sent = counts['sent'] or 1
+        answered = counts['ok'] + counts['no_face']
+        return {
+            'clients': clients,
+            'offered_fps': clients / interval,
+            'throughput_fps': answered / seconds,
+            **counts,
+            'error_rate': counts['errors'] / sent,
+            'drop_rate': counts['dropped'] / sent,
+            'latency': summarize(latencies),
+        }
+
+
+class HttpClient:
+    """Cliente de /process-image o /process-roi; cada hilo del pool reutiliza su conexión"""
+
+    def __init__(self, generator, token):
+        self.generator = generator
+        self.token = token
+
+    def send(self, payload, scheduled, stats):
+        self.generator.pool.submit(self.generator.post, self.token, payload, scheduled, stats)
+
+    def close(self):
+        pass
+
+
+class StreamClient:
+    """Cliente de /stream: una conexión WebSocket y un hilo lector por cliente"""
+
+    def __init__(self, generator, token):
+        from simple_websocket import Client
+
+        url = urlsplit(generator.url)
+        scheme = "wss" if url.scheme == "https" else "ws"
+        self.ws = Client.connect(f"{scheme}://{url.netloc}/stream?session={session_key(token)}")
+        self.ws.send(json.dumps({"token": token}))
+        self._pending = deque()  # (instante programado, stats) de los frames sin respuesta
+        self._closed = False
+        threading.Thread(target=self._read, name=f"stream-{token}", daemon=True).start()
+
+    def send(self, payload, scheduled, stats):
+        self._pending.append((scheduled, stats))
+        try:
+            self.ws.send(payload)
+        except Exception:
+            self._pending.pop()
+            if stats is not None:
+                stats.record('errors')
+
+    def _read(self):
+        while not self._closed:
+            try:
+                message = self.ws.receive()
+            except Exception:
+                return
+            if message is None or not self._pending:
+                continue
+            scheduled, stats = self._pending.popleft()
+            if stats is not None:
+                stats.record(*classify(message, time.perf_counter() - scheduled))
+
+    def close(self):
+        self._closed = True
+        self.ws.close()
+
+
+def classify(body, latency):
+    """(resultado, latencia en ms) a partir de una respuesta JSON del backend"""
+    try:
+        data = json.loads(body)
+    except (TypeError, ValueError):
+        return 'errors', None
+    if data.get('dropped'):
+        return 'dropped', None
+    if 'error' in data:
+        return 'errors', None
+    return ('no_face' if data.get('gesture') == 0 else 'ok'), latency * 1000
+
+
+class LoadGenerator:
+    """Programa los envíos de todos los clientes cada `interval` segundos desde un solo hilo"""
+
+    def __init__(self, url, mode, payloads, interval=0.5, timeout=10.0, max_clients=256):
+        self.url = url.rstrip("/")
+        self.mode = mode
+        self.payloads = payloads
+        self.interval = interval
+        self.timeout = timeout
+        self.run_id = uuid.uuid4().hex[:8]
+        self.pool = ThreadPoolExecutor(max_workers=max(8, max_clients * 4), thread_name_prefix="loadtest")
+        self._local = threading.local()
+        self._clients = []
+        self._schedule = []  # heap de (próximo envío, índice del cliente, índice del frame)
+        self._lock = threading.Lock()
+        self._stats = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loadtest-scheduler", daemon=True)
+        self._thread.start()
+
+    def set_clients(self, count):
+        """Agrega clientes hasta llegar a `count`, con fases al azar para no enviar todos juntos"""
+        now = time.perf_counter()
+        while len(self._clients) < count:
+            index = len(self._clients)
+            token = f"loadtest-{self.run_id}-{index}"
+            client = StreamClient(self, token) if self.mode == "stream" else HttpClient(self, token)
+            with self._lock:
+                self._clients.append(client)
+                heapq.heappush(self._schedule, (now + random.uniform(0, self.interval), index,
+                                                random.randrange(len(self.payloads))))
+
+    def measure(self, stats):
+        """Los frames enviados a partir de ahora se cuentan en `stats` (None = no se miden)"""
+        self._stats = stats
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                item = self._schedule[0] if self._schedule else None
+            if item is None:
+                time.sleep(0.01)
+                continue
+            scheduled, index, frame = item
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                self._stopping.wait(min(delay, 0.05))
+                continue
+            with self._lock:
+                heapq.heapreplace(self._schedule, (scheduled + self.interval, index, (frame + 1) % len(self.payloads)))
+            stats = self._stats
+            if stats is not None:
+                stats.sent()
+            self._clients[index].send(self.payloads[frame], scheduled, stats)
+
+    def post(self, token, payload, scheduled, stats):
+        """Envía un frame por HTTP desde un hilo del pool (conexión reutilizada por hilo)"""
+        url = urlsplit(self.url)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+            connection = self._local.connection = connection_class(url.netloc, timeout=self.timeout)
+        if self.mode == "roi":
+            path, content_type = "/process-roi", "application/octet-stream"
+        else:
+            path, content_type = "/process-image", f"multipart/form-data; boundary={BOUNDARY}"
+        try:
+            connection.request("POST", path, body=payload,
+                               headers={"Authorization": f"Bearer {token}", "Content-Type": content_type})
+            response = connection.getresponse()
+            body = response.read()
+            latency = time.perf_counter() - scheduled
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            if stats is not None:
+                stats.record('errors')
+            return
+        if stats is None:
+            return
+        if response.status == 429:
+            stats.record('dropped')
+        elif response.status != 200:
+            stats.record('errors')
+        else:
+            stats.record(*classify(body, latency))
+
+    def close(self):
+        self._stopping.set()
+        self._thread.join()
+        for client in self._clients:
+            client.close()
+        self.pool.shutdown(wait=False)
+
+
+def wait_until_ready(url, timeout=120.0):
+    """Espera a que /readyz responda 200 (modelos cargados)"""
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.netloc, timeout=5)
+            connection.request("GET", "/readyz")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"{url} no estuvo listo en {timeout:.0f} s")
+
+
+def meets_slo(stage, args):
+    latency = stage['latency']
+    p95 = latency.get('p95_ms')
+    return (p95 is not None and p95 <= args.slo_p95_ms
+            and stage['error_rate'] <= args.max_error_rate
+            and stage['drop_rate'] <= args.max_drop_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Carpeta de imágenes o archivo de video")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--mode", choices=("image", "roi", "stream"), default="image")
+    parser.add_argument("--limit", type=int, default=200, help="Máximo de frames del corpus")
+    parser.add_argument("--interval", type=float, default=0.5, help="Segundos entre frames de un cliente")
+    parser.add_argument("--start", type=int, default=1, help="Clientes de la primera etapa")
+    parser.add_argument("--step", type=int, default=2, help="Clientes que se agregan en cada etapa")
+    parser.add_argument("--max-clients", type=int, default=128)
+    parser.add_argument("--settle", type=float, default=5.0, help="Segundos sin medir tras agregar clientes")
+    parser.add_argument("--stage-seconds", type=float, default=20.0, help="Segundos medidos por etapa")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Segundos antes de dar un frame por perdido")
+    parser.add_argument("--slo-p95-ms", type=float, default=500.0,
+                        help="p95 máximo de latencia (por defecto el intervalo de captura)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-drop-rate", type=float, default=0.05, help="Fracción máxima de frames con 429")
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+
+    if args.mode == "stream":
+        try:
+            import simple_websocket  # noqa: F401
+        except ImportError:
+            parser.error("El modo stream necesita el paquete simple-websocket")
+    frames = list(iter_jpeg_frames(args.source, limit=args.limit))
+    if not frames:
+        parser.error(f"No se encontraron frames en {args.source}")
+    if args.mode == "roi":
+        payloads = [raw_roi(jpeg) for jpeg in frames]
+    elif args.mode == "image":
+        payloads = [multipart_body(jpeg) for jpeg in frames]
+    else:
+        payloads = frames
+
+    wait_until_ready(args.url)
+    generator = LoadGenerator(args.url, args.mode, payloads, args.interval, args.timeout, args.max_clients)
+    stages = []
+    sustainable = None
+    try:
+        clients = args.start
+        while clients <= args.max_clients:
+            generator.set_clients(clients)
+            generator.measure(None)
+            time.sleep(args.settle)
+            stats = StageStats()
+            generator.measure(stats)
+            time.sleep(args.stage_seconds)
+            generator.measure(None)
+            stats.wait(args.timeout)
+
+            stage = stats.summary(clients, args.stage_seconds, args.interval)
+            stage['meets_slo'] = meets_slo(stage, args)
+            stages.append(stage)
+            latency = stage['latency']
+            print(f"{clients:4d} clientes: {stage['throughput_fps']:6.1f} fps de {stage['offered_fps']:.1f}, "
+                  f"p50 {latency.get('p50_ms', float('nan')):6.0f} ms  p95 {latency.get('p95_ms', float('nan')):6.0f} ms  "
+                  f"p99 {latency.get('p99_ms', float('nan')):6.0f} ms, errores {stage['error_rate']:.1%}, "
+                  f"descartados {stage['drop_rate']:.1%} {'✅' if stage['meets_slo'] else '❌'}", flush=True)
+            if not stage['meets_slo']:
+                break
+            sustainable = stage
+            clients += args.step
+    finally:
+        generator.close()
+
+    result = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'revision': git_revision(),
+        'url': args.url,
+        'mode': args.mode,
+        'source': args.source,
+        'slo': {'p95_ms': args.slo_p95_ms, 'max_error_rate': args.max_error_rate, 'max_drop_rate': args.max_drop_rate},
+        'interval_s': args.interval,
+        'max_sustainable_sessions': sustainable['clients'] if sustainable else 0,
+        'sustainable_stage': sustainable,
+        'stages': stages,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    if sustainable:
+        print(f"Máximo sostenible: {sustainable['clients']} sesiones a {1 / args.interval:.0f} fps "
+              f"({sustainable['throughput_fps']:.1f} frames/s, p95 {sustainable['latency']['p95_ms']:.0f} ms)")
+    else:
+        print("Ninguna etapa cumplió el SLO")
+    if stages and stages[-1]['meets_slo']:
+        print(f"El SLO no se rompió hasta {args.max_clients} clientes: aumente --max-clients")
+    print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
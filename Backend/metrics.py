@@ -0,0 +1,127 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Límites superiores de los buckets de latencia, en segundos
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + list(extra or ())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Histograma de buckets fijos: observe() es una búsqueda binaria y dos sumas bajo un lock"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """(conteos acumulados por bucket incluyendo +Inf, suma, total)"""
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total_sum, running
+
+
+class MetricsRegistry:
+    """Contadores, histogramas y gauges del proceso; render() produce el formato de texto de Prometheus"""
+
+    def __init__(self, prefix="vigil"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._families = {}  # nombre -> (tipo, ayuda, {etiquetas: métrica})
+        self._gauges = {}  # nombre -> (ayuda, fn)
+
+    def _get(self, kind, name, help_text, labels, factory):
+        name = f"{self.prefix}_{name}"
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            if family[0] != kind:
+                raise ValueError(f"La métrica {name} ya existe como {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS, **labels):
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name, help_text, fn):
+        """Valor calculado al exportar: fn() devuelve un número o un dict {valor de etiqueta 'name': número}"""
+        with self._lock:
+            self._gauges[f"{self.prefix}_{name}"] = (help_text, fn)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Mide la duración del bloque `with` en el histograma indicado"""
+        histogram = self.histogram(name, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                        for name, (kind, help_text, metrics) in sorted(self._families.items())]
+            gauges = sorted(self._gauges.items())
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(metrics, key=lambda item: item[0]):
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                cumulative, total_sum, count = metric.snapshot()
+                for bound, value in zip(list(metric.buckets) + ["+Inf"], cumulative):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {value}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total_sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for name, (help_text, fn) in gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"⚠️ Error calculando la métrica {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for label, number in sorted(value.items()):
+                    lines.append(f'{name}{{name="{label}"}} {float(number)}')
+            else:
+                lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
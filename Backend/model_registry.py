@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+MODEL_EXTENSIONS = (".h5", ".keras", ".tflite")
+# Capas que identifican a un modelo de secuencia (índice de somnolencia)
+INDEX_LAYERS = ("DrowsinessIndexLayer",)
+
+
+def model_kind(path):
+    """'index' si el .h5 contiene las capas del índice de somnolencia, 'cnn' en otro caso"""
+    if not path.endswith(".h5"):
+        return "cnn"
+    import h5py
+
+    with h5py.File(path, "r") as f:
+        config = json.loads(f.attrs['model_config'])
+    layers = config['config']['layers']
+    return "index" if any(layer['class_name'] in INDEX_LAYERS for layer in layers) else "cnn"
+
+
+def list_models(directory):
+    """{nombre de archivo: 'cnn' o 'index'} de los modelos de una carpeta"""
+    models = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(MODEL_EXTENSIONS) and os.path.isfile(path):
+            try:
+                models[name] = model_kind(path)
+            except Exception as e:
+                print(f"⚠️ No se pudo inspeccionar el modelo {name}: {e}")
+    return models
+
+
+def ab_bucket(token):
+    """Valor estable en [0, 1) por token, para repartir las sesiones entre variantes"""
+    digest = hashlib.sha1(str(token).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') / 2 ** 32
+
+
+class ModelEntry:
+    """Un modelo cargado y calentado, listo para servir"""
+
+    def __init__(self, name, runner):
+        self.name = name
+        self.runner = runner
+        self.loaded_at = time.time()
+        # TFLiteModel no es seguro entre hilos: el hilo del lote y el de sombra se turnan
+        self.lock = threading.Lock()
+
+    def __call__(self, inputs):
+        with self.lock:
+            return self.runner(inputs)
+
+
+class ModelComparison:
+    """Concordancia entre el modelo activo y el candidato sobre las mismas ROIs"""
+
+    def __init__(self, num_classes=3):
+        self._lock = threading.Lock()
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = {'batches': 0, 'rows': 0, 'agreements': 0, 'skipped_batches': 0}
+            self._prob_diff_sum = 0.0
+            self._prob_diff_max = 0.0
+            self._candidate_seconds = 0.0
+            self._confusion = np.zeros((self.num_classes, self.num_classes), dtype=np.int64)
+
+    def record(self, active, candidate, seconds):
+        active_classes = np.argmax(active, axis=1)
+        candidate_classes = np.argmax(candidate, axis=1)
+        diff = np.abs(np.asarray(active, dtype=np.float32) - np.asarray(candidate, dtype=np.float32)).max(axis=1)
+        with self._lock:
+            self._counts['batches'] += 1
+            self._counts['rows'] += len(active)
+            self._counts['agreements'] += int(np.sum(active_classes == candidate_classes))
+            self._prob_diff_sum += float(diff.sum())
+            self._prob_diff_max = max(self._prob_diff_max, float(diff.max()))
+            self._candidate_seconds += seconds
+            np.add.at(self._confusion, (active_classes, candidate_classes), 1)
+
+    def record_skipped(self):
+        with self._lock:
+            self._counts['skipped_batches'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counts)
+            rows, batches = stats['rows'], stats['batches']
+            stats['agreement'] = stats['agreements'] / rows if rows else 1.0
+            stats['mean_prob_diff'] = self._prob_diff_sum / rows if rows else 0.0
+            stats['max_prob_diff'] = self._prob_diff_max
+            stats['candidate_ms_per_batch'] = self._candidate_seconds / batches * 1000 if batches else 0.0
+            # Filas: clase del modelo activo; columnas: clase del candidato
+            stats['confusion'] = self._confusion.tolist()
+        return stats
+
+
+class CnnModelRegistry:
+    """Modelos de la CNN cargados en el proceso: el activo y, opcionalmente, un candidato.
+
+    `loader(nombre)` carga y calienta un modelo y devuelve un callable (CompiledModel o
+    TFLiteModel). La carga ocurre fuera del camino de las peticiones; el cambio es una
+    sola asignación del estado (activo, candidato, modo, fracción), así que cada lote
+    usa el estado completo anterior o el nuevo y los lotes en curso terminan con el
+    modelo con el que empezaron.
+
+    predict() es la función del BatchingScheduler. Con candidato, éste evalúa las mismas
+    ROIs del lote, sin repetir decodificación ni detección:
+    - modo 'shadow': en un hilo aparte, sólo para comparar; si sigue ocupado con el lote
+      anterior, el nuevo se omite y no retrasa al modelo activo.
+    - modo 'ab': en el mismo lote; predict() devuelve ambas salidas apiladas (N, 2, clases)
+      y select() elige por sesión la del candidato para una fracción estable de tokens.
+    """
+
+    MODES = ("shadow", "ab")
+
+    def __init__(self, loader, num_classes=3):
+        self.loader = loader
+        self.comparison = ModelComparison(num_classes)
+        self._state = (None, None, "shadow", 0.0)
+        self._swap_lock = threading.Lock()  # Una carga o cambio a la vez
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cnn-shadow")
+        self._shadow_busy = threading.Event()
+
+    @property
+    def active(self):
+        return self._state[0]
+
+    @property
+    def candidate(self):
+        return self._state[1]
+
+    def _load(self, name):
+        active, candidate, _, _ = self._state
+        for entry in (active, candidate):
+            if entry is not None and entry.name == name:
+                return entry
+        start = time.perf_counter()
+        entry = ModelEntry(name, self.loader(name))
+        print(f"✅ Modelo {os.path.basename(name)} cargado y calentado en {time.perf_counter() - start:.1f} s")
+        return entry
+
+    def activate(self, name):
+        """Carga (si hace falta) y pone en servicio un modelo; si era el candidato, lo promueve"""
+        with self._swap_lock:
+            entry = self._load(name)
+            _, candidate, mode, fraction = self._state
+            if candidate is not None and candidate.name == name:
+                candidate, mode, fraction = None, "shadow", 0.0
+            self._state = (entry, candidate, mode, fraction)
+            self.comparison.reset()
+        return entry
+
+    def set_candidate(self, name, mode="shadow", fraction=0.0):
+        """Carga un modelo candidato para compararlo en sombra o servirlo a una fracción de sesiones"""
+        if mode not in self.MODES:
+            raise ValueError(f"Modo no soportado: {mode}")
+        if not 0.0 <= fraction <= 1.0:
+            raise ValueError("La fracción debe estar entre 0 y 1")
+        with self._swap_lock:
+            entry = self._load(name)
+            active = self._state[0]
+            self._state = (active, entry, mode, fraction if mode == "ab" else 0.0)
+            self.comparison.reset()
+        return entry
+
+    def clear_candidate(self):
+        with self._swap_lock:
+            self._state = (self._state[0], None, "shadow", 0.0)
+
+    def predict(self, inputs):
+        active, candidate, mode, _ = self._state
+        outputs = active(inputs)
+        if candidate is None:
+            return outputs
+        if mode == "ab":
+            start = time.perf_counter()
+            candidate_outputs = candidate(inputs)
+            self.comparison.record(outputs, candidate_outputs, time.perf_counter() - start)
+            return np.stack((outputs, candidate_outputs), axis=1)
+        if self._shadow_busy.is_set():
+            self.comparison.record_skipped()
+        else:
+            self._shadow_busy.set()
+            self._shadow_pool.submit(self._run_shadow, candidate, inputs, outputs)
+        return outputs
+
+    def _run_shadow(self, candidate, inputs, outputs):
+        try:
+            start = time.perf_counter()
+            candidate_outputs = candidate(inputs)
+            self.comparison.record(outputs, candidate_outputs, time.perf_counter() - start)
+        except Exception as e:
+            print(f"⚠️ Error en el modelo en sombra {os.path.basename(candidate.name)}: {e}")
+        finally:
+            self._shadow_busy.clear()
+
+    def variant(self, token):
+        """'candidate' si la sesión recibe las predicciones del candidato (modo 'ab'), si no 'active'"""
+        _, candidate, mode, fraction = self._state
+        if candidate is None or mode != "ab" or token is None:
+            return "active"
+        return "candidate" if ab_bucket(token) < fraction else "active"
+
+    def select(self, prediction, token):
+        """Fila de predicción que se sirve a la sesión a partir de la salida de predict()"""
+        prediction = np.asarray(prediction)
+        if prediction.ndim == 1:
+            return prediction
+        return prediction[1 if self.variant(token) == "candidate" else 0]
+
+    def snapshot(self):
+        active, candidate, mode, fraction = self._state
+        return {
+            "active": os.path.basename(active.name) if active else None,
+            "candidate": os.path.basename(candidate.name) if candidate else None,
+            "mode": mode if candidate else None,
+            "ab_fraction": fraction,
+            "comparison": self.comparison.snapshot() if candidate else None,
+        }
+
+    def close(self):
+        self._shadow_pool.shutdown(wait=True)
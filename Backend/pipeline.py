@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+def _set_exception(future, error):
+    """Marca el error salvo que el future ya se haya resuelto o cancelado"""
+    try:
+        future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+class StagedPipeline:
+    """Pipeline de tres etapas con concurrencia configurable en cada una.
+
+    1. `prepare(item)` corre en un pool de `prepare_workers` hilos (decodificación,
+       detección, recorte). Devuelve (entradas del modelo o None, contexto).
+    2. `model.submit(entradas)` es la etapa en lote (BatchingScheduler); se omite si
+       prepare no devolvió entradas, p. ej. sin rostro o con la predicción en caché.
+    3. `finish(contexto, salida del modelo o None)` corre en un pool de `finish_workers`
+       hilos (secuencia de gestos e índice) y su valor es el resultado del item.
+
+    OpenCV, MediaPipe y TensorFlow liberan el GIL en sus operaciones pesadas, así que
+    las etapas se solapan usando hilos. Como mucho hay `max_pending` items dentro del
+    pipeline: submit() se bloquea cuando está lleno, y eso acota también la cola del
+    modelo.
+    """
+
+    def __init__(self, prepare, model, finish, prepare_workers=4, finish_workers=2, max_pending=64,
+                 name="pipeline"):
+        self.prepare = prepare
+        self.model = model
+        self.finish = finish
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._prepare_pool = ThreadPoolExecutor(max_workers=prepare_workers, thread_name_prefix=f"{name}-prepare")
+        self._finish_pool = ThreadPoolExecutor(max_workers=finish_workers, thread_name_prefix=f"{name}-finish")
+
+    def submit(self, item):
+        """Encola un item y devuelve un Future con el resultado de finish()"""
+        self._slots.acquire()
+        result = Future()
+        result.add_done_callback(lambda _: self._slots.release())
+        try:
+            prepared = self._prepare_pool.submit(self.prepare, item)
+        except Exception as e:
+            result.set_exception(e)
+            return result
+        prepared.add_done_callback(lambda f: self._after_prepare(f, result))
+        return result
+
+    def process(self, item, timeout=None):
+        """Versión bloqueante de submit(); si vence `timeout` el item se cancela y libera su lugar"""
+        result = self.submit(item)
+        try:
+            return result.result(timeout=timeout)
+        except FutureTimeoutError:
+            result.cancel()
+            raise
+
+    def _after_prepare(self, prepared, result):
+        try:
+            inputs, context = prepared.result()
+            if inputs is None:
+                self._finish(context, None, result)
+                return
+            predicted = self.model.submit(inputs)
+        except Exception as e:
+            _set_exception(result, e)
+            return
+        # El callback corre en el hilo del modelo: sólo se delega a la etapa final
+        predicted.add_done_callback(lambda f: self._after_model(f, context, result))
+
+    def _after_model(self, predicted, context, result):
+        try:
+            self._finish(context, predicted.result(), result)
+        except Exception as e:
+            _set_exception(result, e)
+
+    def _finish(self, context, outputs, result):
+        def run():
+            try:
+                value = self.finish(context, outputs)
+            except Exception as e:
+                _set_exception(result, e)
+                return
+            # El item pudo cancelarse por tiempo mientras terminaba
+            if not result.cancelled():
+                try:
+                    result.set_result(value)
+                except InvalidStateError:
+                    pass
+        self._finish_pool.submit(run)
+
+    def close(self):
+        self._prepare_pool.shutdown(wait=True)
+        self._finish_pool.shutdown(wait=True)
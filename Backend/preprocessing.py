@@ -0,0 +1,94 @@
+import math
+import cv2
+import numpy as np
+
+ZOOM_FACTOR = 1.2
+
+
+def detect_face_box(frame, face_detection, zoom_factor=ZOOM_FACTOR):
+    """Caja (x1, y1, x2, y2) cuadrada y ampliada alrededor del primer rostro, o None"""
+    return detect_face(frame, face_detection, zoom_factor)[0]
+
+
+def detect_face(frame, face_detection, zoom_factor=ZOOM_FACTOR):
+    """Como detect_face_box, pero devuelve también la confianza de la detección: (caja, score)"""
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    results = face_detection.process(rgb)
+    if not results.detections:
+        return None, 0.0
+
+    detection = results.detections[0]
+    bboxC = detection.location_data.relative_bounding_box
+    box = zoom_relative_box((bboxC.xmin, bboxC.ymin, bboxC.width, bboxC.height), frame.shape, zoom_factor)
+    return box, float(detection.score[0]) if detection.score else 1.0
+
+
+def zoom_relative_box(relative_box, frame_shape, zoom_factor=ZOOM_FACTOR):
+    """Convierte una caja relativa (xmin, ymin, ancho, alto) en la caja ampliada en píxeles"""
+    xmin, ymin, width, height = relative_box
+    ih, iw = frame_shape[:2]
+    x1 = int(xmin * iw)
+    y1 = int(ymin * ih)
+    w = int(width * iw)
+    h = int(height * ih)
+
+    new_size = int(max(w, h) * zoom_factor)
+    center_x, center_y = x1 + w // 2, y1 + h // 2
+    x1 = max(0, center_x - new_size // 2)
+    y1 = max(0, center_y - new_size // 2)
+    x2 = min(iw, center_x + new_size // 2)
+    y2 = min(ih, center_y + new_size // 2)
+    return x1, y1, x2, y2
+
+
+def normalize_roi(roi, target_size=(112, 112)):
+    """Redimensiona, pasa a gris, suaviza y normaliza una ROI BGR -> (1, 112, 112, 1)"""
+    # Redimensionar a tamaño objetivo
+    roi_resized = cv2.resize(roi, target_size, interpolation=cv2.INTER_AREA)
+    roi_gray = cv2.cvtColor(roi_resized, cv2.COLOR_BGR2GRAY)
+    return normalize_gray(roi_gray)
+
+
+def normalize_gray(roi_gray):
+    """Suaviza y normaliza una ROI en gris que ya tiene el tamaño objetivo"""
+    roi_blur = cv2.GaussianBlur(roi_gray, (3, 3), 0)
+    roi_normalized = roi_blur / 255.0
+    return np.expand_dims(roi_normalized, axis=(0, -1))  # (1, 112, 112, 1)
+
+
+def parse_raw_roi(buffer, target_size=(112, 112)):
+    """Vista (alto, ancho) uint8 sobre una ROI gris cruda, sin copiar; None si el tamaño no cuadra"""
+    width, height = target_size
+    if len(buffer) != width * height:
+        return None
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(height, width)
+
+
+def parse_relative_box(text):
+    """Caja "xmin,ymin,ancho,alto" relativa (0-1) enviada por el cliente; None si no es válida"""
+    try:
+        xmin, ymin, width, height = (float(v) for v in text.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not all(math.isfinite(v) for v in (xmin, ymin, width, height)):
+        return None
+    if width <= 0 or height <= 0 or not (0 <= xmin <= 1 and 0 <= ymin <= 1):
+        return None
+    return xmin, ymin, width, height
+
+
+def crop_and_normalize(frame, box, target_size=(112, 112)):
+    """Recorta la caja del frame y la normaliza; None si el recorte queda vacío"""
+    x1, y1, x2, y2 = box
+    roi = frame[y1:y2, x1:x2]
+    if roi.size == 0:
+        return None
+    return normalize_roi(roi, target_size)
+
+
+def preprocess_frame(frame, face_detection, target_size=(112, 112)):
+    """Preprocesamiento completo de producción: detección, recorte y normalización"""
+    box = detect_face_box(frame, face_detection)
+    if box is None:
+        return None
+    return crop_and_normalize(frame, box, target_size)
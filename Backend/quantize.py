@@ -0,0 +1,134 @@
+"""Convierte las CNN de gestos a TFLite cuantizado y reporta la pérdida de precisión.
+
+Uso:
+    python quantize.py --rois ./rois [--models ./models/2105.h5 ...] [--out ./models]
+
+`--rois` es una carpeta de imágenes: las de 112x112 se toman como ROIs ya recortadas y
+el resto pasa por el mismo preprocesamiento de producción (detección + recorte).
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+import cv2
+import tensorflow as tf
+
+from inference import CompiledModel, TFLiteModel
+
+DEFAULT_MODELS = ["./models/2105.h5", "./models/model1705.h5", "./models/model1805.h5"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_representative_rois(directory, limit=None, target_size=(112, 112)):
+    """ROIs normalizadas (N, 112, 112, 1) a partir de una carpeta de imágenes"""
+    from face_detection_pool import FaceDetectorPool
+    from preprocessing import normalize_roi, preprocess_frame
+
+    paths = sorted(p for p in glob.glob(os.path.join(directory, "**", "*"), recursive=True)
+                   if p.lower().endswith(IMAGE_EXTENSIONS))
+    pool = FaceDetectorPool(size=1)
+    rois = []
+    for path in paths:
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            continue
+        if frame.shape[:2] == target_size[::-1]:
+            roi = normalize_roi(frame, target_size)
+        else:
+            with pool.acquire() as face_detection:
+                roi = preprocess_frame(frame, face_detection, target_size)
+        if roi is not None:
+            rois.append(roi.astype(np.float32))
+        if limit and len(rois) >= limit:
+            break
+    pool.close()
+    if not rois:
+        raise ValueError(f"No se obtuvo ninguna ROI de {directory}")
+    return np.concatenate(rois, axis=0)
+
+
+def convert(model, mode, calibration_rois=None):
+    """Modelo TFLite serializado: 'dynamic' (pesos int8) o 'int8' (enteros completos)"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == "int8":
+        if calibration_rois is None:
+            raise ValueError("La cuantización int8 necesita ROIs de calibración")
+
+        def representative_dataset():
+            for roi in calibration_rois:
+                yield [roi[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif mode != "dynamic":
+        raise ValueError(f"Modo de cuantización desconocido: {mode}")
+    return converter.convert()
+
+
+def latency_ms(runner, rois, repeats=3):
+    runner(rois[:1])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(len(rois)):
+            runner(rois[i:i + 1])
+    return (time.perf_counter() - start) / (repeats * len(rois)) * 1000
+
+
+def accuracy_delta(reference, candidate):
+    """Diferencias de la variante cuantizada frente al modelo float"""
+    return {
+        'top1_agreement': float(np.mean(np.argmax(reference, axis=1) == np.argmax(candidate, axis=1))),
+        'mean_abs_prob_diff': float(np.mean(np.abs(reference - candidate))),
+        'max_abs_prob_diff': float(np.max(np.abs(reference - candidate))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rois", required=True, help="Carpeta de imágenes representativas")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--out", default="./models")
+    parser.add_argument("--modes", nargs="+", default=["dynamic", "int8"], choices=["dynamic", "int8"])
+    parser.add_argument("--calibration", type=int, default=200, help="ROIs usadas para calibrar int8")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de ROIs a cargar")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--report", default="quantization_report.json")
+    args = parser.parse_args()
+
+    rois = load_representative_rois(args.rois, limit=args.limit)
+    calibration = rois[:args.calibration]
+    print(f"{len(rois)} ROIs cargadas ({len(calibration)} para calibración)")
+
+    report = {'rois': int(len(rois)), 'threads': args.threads, 'models': {}}
+    for model_path in args.models:
+        model = tf.keras.models.load_model(model_path)
+        reference_runner = CompiledModel(model, (None,) + rois.shape[1:])
+        reference = reference_runner(rois)
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        entry = {'float': {'size_bytes': os.path.getsize(model_path),
+                           'latency_ms': latency_ms(reference_runner, rois)}}
+
+        for mode in args.modes:
+            out_path = os.path.join(args.out, f"{name}_{mode}.tflite")
+            with open(out_path, "wb") as f:
+                f.write(convert(model, mode, calibration))
+            runner = TFLiteModel(out_path, num_threads=args.threads)
+            candidate = np.concatenate([runner(rois[i:i + 64]) for i in range(0, len(rois), 64)])
+            entry[mode] = {'path': out_path, 'size_bytes': os.path.getsize(out_path),
+                           'latency_ms': latency_ms(runner, rois), **accuracy_delta(reference, candidate)}
+            print(f"{name} [{mode}]: acuerdo top-1 {entry[mode]['top1_agreement']:.2%}, "
+                  f"{entry[mode]['latency_ms']:.2f} ms/ROI (float {entry['float']['latency_ms']:.2f} ms)")
+        report['models'][name] = entry
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Reporte guardado en {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+SIGNATURE_SIZE = (16, 16)
+
+
+def roi_signature(roi_expanded, size=SIGNATURE_SIZE):
+    """Versión reducida (16x16, float32) de una ROI normalizada (1, 112, 112, 1)"""
+    roi = np.asarray(roi_expanded, dtype=np.float32).reshape(roi_expanded.shape[1:3])
+    return cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+
+
+class CacheMetrics:
+    """Aciertos y fallos de todas las cachés de ROI"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'misses': 0, 'expired': 0}
+
+    def record(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counts)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+class RoiPredictionCache:
+    """Reutiliza la última predicción de la CNN de una sesión si la ROI casi no cambió.
+
+    Se compara la versión reducida de la ROI con la de la ROI que produjo la predicción
+    guardada; la distancia es la mayor diferencia por celda (en escala 0-1), así un cambio
+    local como cerrar los ojos no se diluye en el promedio. La predicción caduca a los
+    `max_age` segundos aunque los frames sigan siendo iguales.
+    """
+
+    def __init__(self, max_distance=0.03, max_age=2.0, metrics=None):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.metrics = metrics or CacheMetrics()
+        self._lock = threading.Lock()
+        self._signature = None
+        self._prediction = None
+        self._stored_at = 0.0
+
+    def lookup(self, roi_expanded):
+        """Predicción guardada si la ROI está a menos de `max_distance` y no caducó; si no, None"""
+        signature = roi_signature(roi_expanded)
+        with self._lock:
+            if self._signature is not None:
+                if time.monotonic() - self._stored_at > self.max_age:
+                    self._signature = None
+                    self.metrics.record('expired')
+                elif float(np.max(np.abs(signature - self._signature))) <= self.max_distance:
+                    self.metrics.record('hits')
+                    return self._prediction
+            self.metrics.record('misses')
+            return None
+
+    def store(self, roi_expanded, prediction):
+        signature = roi_signature(roi_expanded)
+        with self._lock:
+            self._signature = signature
+            self._prediction = prediction
+            self._stored_at = time.monotonic()
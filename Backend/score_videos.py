@@ -0,0 +1,223 @@
+"""Puntuación offline de videos grabados con el mismo pipeline de producción.
+
+Cada video se decodifica frame a frame con un generador y pasa por las mismas funciones
+que /process-image: detección con el pool de MediaPipe, recorte y normalización
+(crop_and_normalize), la CNN de CNN.load_models() y la secuencia de gestos con el índice
+de somnolencia del backend configurado (VIGIL_INDEX_BACKEND). La detección de un lote se
+reparte entre los detectores del pool y las ROIs del lote van en una sola llamada a la CNN.
+Como la re-detección diferida del tracker depende del frame anterior, aquí se detecta el
+rostro en todos los frames.
+
+Los videos se reparten entre procesos (uno por núcleo por defecto); cada proceso carga sus
+propios modelos. Por cada video se escribe <salida>/<video>.timeline.csv (con un hash de la
+ruta si dos videos se llaman igual) con una fila por frame: número de frame, segundo, gesto
+(0 = sin rostro, como en la API), probabilidad de la CNN e índice de somnolencia (0-100)
+tras ese frame.
+
+Uso:
+    python score_videos.py viaje1.mp4 viaje2.mp4 --output timelines/
+    python score_videos.py dashcam/*.mp4 --stride 3 --processes 4
+"""
+import argparse
+import csv
+import hashlib
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+import cv2
+
+TIMELINE_COLUMNS = ["frame", "time_s", "gesture", "gesture_name", "probability", "drowsiness_index"]
+
+
+def iter_video_frames(path, stride=1):
+    """Genera (número de frame, segundo, frame BGR) de un video, uno de cada `stride` frames"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"No se pudo abrir el video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    try:
+        number = 0
+        while True:
+            # grab() avanza sin decodificar: los frames saltados no cuestan la conversión
+            if not capture.grab():
+                return
+            if number % stride == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    return
+                yield number, (number / fps if fps else None), frame
+            number += 1
+    finally:
+        capture.release()
+
+
+def batched(iterable, size):
+    """Agrupa un iterable en listas de hasta `size` elementos"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetched(iterable, depth=2):
+    """Recorre `iterable` en un hilo aparte con hasta `depth` elementos por adelantado.
+
+    La decodificación del siguiente lote se solapa así con la detección y la CNN del actual
+    (OpenCV libera el GIL al decodificar).
+    """
+    items = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        items.put(done)
+
+    threading.Thread(target=produce, name="video-decoder", daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+# ================= PROCESOS WORKER =================
+def init_worker(tf_threads):
+    """Carga los modelos una vez por proceso, antes de recibir videos"""
+    os.environ["VIGIL_DEFER_MODELS"] = "1"
+    from serve import configure_tf_threads
+    configure_tf_threads(tf_threads)
+    import CNN
+    CNN.load_models()
+
+
+def timeline_names(paths):
+    """Nombre de la línea de tiempo de cada video: el del archivo, más un hash de la ruta si se repite"""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    repeated = {stem for stem in stems if stems.count(stem) > 1}
+    return {path: (f"{stem}_{hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]}"
+                   if stem in repeated else stem)
+            for path, stem in zip(paths, stems)}
+
+
+def score_video(path, output_dir, stride=1, batch_size=None, name=None):
+    """Puntúa un video completo y escribe su línea de tiempo; devuelve un resumen"""
+    import CNN
+    from preprocessing import crop_and_normalize
+
+    batch_size = batch_size or CNN.CNN_MAX_BATCH
+    token = f"video:{os.path.abspath(path)}"
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    timeline_path = os.path.join(output_dir, f"{name}.timeline.csv")
+    counts = {"No face detected": 0, **{gesture: 0 for gesture in CNN.class_names}}
+    frames = 0
+    max_index = 0
+
+    start = time.perf_counter()
+    detectors = ThreadPoolExecutor(max_workers=CNN.DETECTOR_POOL_SIZE, thread_name_prefix="detect")
+    try:
+        with open(timeline_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TIMELINE_COLUMNS)
+            for batch in prefetched(batched(iter_video_frames(path, stride), batch_size)):
+                # Detección repartida entre los detectores del pool y una llamada a la CNN por lote
+                boxes = list(detectors.map(lambda item: CNN.detect_with_pool(item[2])[0], batch))
+                rois = [crop_and_normalize(frame, box) if box is not None else None
+                        for (_, _, frame), box in zip(batch, boxes)]
+                with_face = [roi for roi in rois if roi is not None]
+                predictions = iter(CNN.cnn_registry.active(np.concatenate(with_face)) if with_face else ())
+
+                for (number, seconds, _), roi in zip(batch, rois):
+                    if roi is None:
+                        gesture, gesture_name, probability = 0, "No face detected", 0.0
+                    else:
+                        prediction = next(predictions)
+                        gesture = int(np.argmax(prediction)) + 1
+                        gesture_name = CNN.class_names[gesture - 1]
+                        probability = float(prediction[gesture - 1])
+                        CNN.update_gesture_sequence(gesture_name, token)
+                    drowsiness_index = CNN.get_drowsiness_index(token)
+                    writer.writerow([number, "" if seconds is None else f"{seconds:.3f}", gesture,
+                                     gesture_name, f"{probability:.4f}", drowsiness_index])
+                    counts[gesture_name] += 1
+                    max_index = max(max_index, drowsiness_index)
+                frames += len(batch)
+    finally:
+        detectors.shutdown()
+        CNN.gesture_sessions.discard(token)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "video": path,
+        "timeline": timeline_path,
+        "frames": frames,
+        "elapsed_s": elapsed,
+        "fps": frames / elapsed if elapsed else None,
+        "gestures": counts,
+        "max_drowsiness_index": max_index,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+", help="Archivos de video")
+    parser.add_argument("--output", default="timelines", help="Carpeta de las líneas de tiempo")
+    parser.add_argument("--stride", type=int, default=1,
+                        help="Puntuar uno de cada N frames (p. ej. 3 para bajar un video de 30 fps a 10 fps)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Frames por lote de detección y CNN (por defecto VIGIL_CNN_MAX_BATCH)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Procesos en paralelo (por defecto uno por núcleo, sin pasar del número de videos)")
+    args = parser.parse_args()
+
+    missing = [path for path in args.videos if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"No existen: {', '.join(missing)}")
+    if args.stride < 1:
+        parser.error("--stride debe ser al menos 1")
+    os.makedirs(args.output, exist_ok=True)
+    # Un video repetido se puntúa una vez; los de igual nombre en carpetas distintas no se pisan
+    names = timeline_names(list({os.path.abspath(path): path for path in args.videos}.values()))
+    processes = args.processes or min(len(names), os.cpu_count() or 1)
+    tf_threads = max(1, (os.cpu_count() or 1) // processes)
+
+    start = time.perf_counter()
+    total_frames = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(tf_threads,)) as pool:
+        futures = {pool.submit(score_video, path, args.output, args.stride, args.batch_size, name): path
+                   for path, name in names.items()}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {futures[future]}: {e}", flush=True)
+                continue
+            total_frames += summary["frames"]
+            gestures = ", ".join(f"{name}: {count}" for name, count in summary["gestures"].items())
+            print(f"✅ {summary['video']}: {summary['frames']} frames en {summary['elapsed_s']:.1f} s "
+                  f"({summary['fps']:.1f} fps), índice máximo {summary['max_drowsiness_index']} "
+                  f"[{gestures}] -> {summary['timeline']}", flush=True)
+    elapsed = time.perf_counter() - start
+
+    print(f"{total_frames} frames de {len(names) - failed} videos en {elapsed:.1f} s "
+          f"({total_frames / elapsed:.1f} fps con {processes} procesos, incluida la carga de modelos)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
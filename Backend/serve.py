@@ -0,0 +1,159 @@
+"""Servidor de producción: varios procesos worker creados con fork a partir de un proceso precargado.
+
+El proceso principal importa TensorFlow (al fijar sus hilos con configure_tf_threads) y
+una sola vez CNN con Flask y los parámetros del índice, y luego crea los workers con fork,
+que comparten esas páginas (copy-on-write). MediaPipe y los modelos no se importan en el
+padre: el runtime de TensorFlow se bloquea si se bifurca después de ejecutar un grafo, así
+que cada worker carga y calienta sus grafos y detectores (CNN.load_models) ya bifurcado,
+en segundo plano mientras responde /healthz y /readyz.
+Cada worker escucha en su propio puerto (--port + i) y guarda el estado de las sesiones
+que atiende; el balanceador reparte por token con hash consistente (ver README), de
+modo que cada sesión vive siempre en el mismo worker.
+
+Uso:
+    python serve.py --workers 4 --port 5000
+"""
+import argparse
+import gc
+import os
+import signal
+import sys
+import threading
+import time
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def configure_tf_threads(threads):
+    """Limita los hilos de TensorFlow por worker; debe llamarse antes de cargar los modelos"""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_worker(index, host, port, drain_timeout):
+    """Cuerpo de un worker: sirve la app hasta recibir SIGTERM/SIGINT y se apaga ordenadamente"""
+    from werkzeug.serving import make_server
+    import CNN
+
+    # El worker acepta conexiones enseguida: /healthz responde y /readyz da 503 hasta que
+    # el hilo de carga termine, así el balanceador no le envía frames antes de tiempo
+    CNN.startup["process_started"] = time.perf_counter()
+    CNN.start_background_load()
+    CNN.initialize_excel()
+    server = make_server(host, port, CNN.app, threaded=True)
+
+    def stop(signum, frame):
+        # shutdown() espera a que serve_forever() termine: debe llamarse desde otro hilo
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"🚀 Worker {index} (pid {os.getpid()}) escuchando en {host}:{port}", flush=True)
+    server.serve_forever()
+    server.server_close()
+
+    # Dejar terminar los frames que ya estaban en proceso antes de liberar los recursos
+    deadline = time.monotonic() + drain_timeout
+    while CNN.frame_admission.snapshot()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    CNN.shutdown()
+    print(f"👋 Worker {index} detenido", flush=True)
+
+
+class Supervisor:
+    """Crea los workers, reinicia los que mueren y los detiene ordenadamente al recibir una señal"""
+
+    def __init__(self, workers, host, port, drain_timeout=10.0, shutdown_timeout=30.0):
+        self.num_workers = workers
+        self.host = host
+        self.port = port
+        self.drain_timeout = drain_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.stopping = False
+        self.workers = {}
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            # Un worker reiniciado hereda los manejadores del supervisor: una señal durante la
+            # carga de modelos detendría a los demás workers. run_worker instala los suyos.
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self.workers = {}
+            code = 0
+            try:
+                run_worker(index, self.host, self.port + index, self.drain_timeout)
+            except Exception as e:
+                print(f"❌ Worker {index} terminó con error: {e}", flush=True)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        for index in range(self.num_workers):
+            self.spawn(index)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while self.workers and not self.stopping:
+            pid, status = os.wait()
+            index = self.workers.pop(pid, None)
+            if index is not None and not self.stopping:
+                print(f"⚠️ Worker {index} (pid {pid}) terminó inesperadamente ({status}), reiniciando", flush=True)
+                time.sleep(1)
+                self.spawn(index)
+
+        # Apagado: esperar a los workers y forzar a los que no terminen a tiempo
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.workers and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.workers.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000, help="Puerto del primer worker; el worker i usa port + i")
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--tf-threads", type=int, default=None,
+                        help="Hilos de TensorFlow por worker (por defecto núcleos / workers)")
+    parser.add_argument("--drain-timeout", type=float, default=10.0,
+                        help="Segundos que un worker espera a los frames en curso al apagarse")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        parser.error("serve.py necesita fork(); en esta plataforma use un solo proceso (python CNN.py)")
+    configure_tf_threads(args.tf_threads or max(1, (os.cpu_count() or 1) // args.workers))
+
+    # Importación de las dependencias y la app una sola vez, antes de crear los workers
+    start = time.perf_counter()
+    os.environ["VIGIL_DEFER_MODELS"] = "1"
+    import CNN  # noqa: F401
+    print(f"✅ App precargada en {time.perf_counter() - start:.1f} s, iniciando {args.workers} workers", flush=True)
+    # Los objetos ya importados no cambian: sacarlos del recolector evita que toque (y copie) sus páginas
+    gc.freeze()
+
+    Supervisor(args.workers, args.host, args.port, args.drain_timeout, args.shutdown_timeout).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+INDEX_MODELS = ("Modelo_6_capas.h5", "Modelo_6_capas_2.h5")
+
+
+def models_dir():
+    """Carpeta de modelos: VIGIL_MODELS_DIR, o Backend/models (Backend/Models en el repositorio)"""
+    candidates = [os.environ.get("VIGIL_MODELS_DIR")] + [os.path.join(BACKEND_DIR, name) for name in ("models", "Models")]
+    for directory in candidates:
+        if directory and os.path.isdir(directory):
+            return directory
+    return None
+
+
+@pytest.fixture(scope="session", params=INDEX_MODELS)
+def index_model_path(request):
+    directory = models_dir()
+    path = os.path.join(directory, request.param) if directory else None
+    if path is None or not os.path.isfile(path):
+        pytest.skip(f"No se encontró el modelo {request.param}")
+    return path
+
+
+@pytest.fixture(scope="session")
+def index_model(index_model_path):
+    """(modelo Keras con las capas de custom_layers, DrowsinessParams) de un modelo del índice"""
+    tf = pytest.importorskip("tensorflow")
+    from custom_layers import CUSTOM_OBJECTS
+    from drowsiness_engine import DrowsinessParams
+
+    model = tf.keras.models.load_model(index_model_path, custom_objects=CUSTOM_OBJECTS, compile=False)
+    return model, DrowsinessParams.from_h5(index_model_path)
@@ -0,0 +1,100 @@
+"""Paridad del índice de somnolencia: capas vectorizadas frente a las originales con tf.map_fn,
+y evaluador incremental, motor NumPy y secuencias largas frente a las capas del modelo."""
+import numpy as np
+import pytest
+from benchmark import random_gesture_windows
+from drowsiness_engine import (ATTENTION, EYESCLOSED, WINDOW, YAWNING, NumpyDrowsinessModel,
+                               StreamingDrowsinessEvaluator)
+
+TOLERANCE = 1e-5
+REFERENCE_LAYER_NAMES = ('DrowsinessIndexLayer', 'EyesClosedConsecutiveAdjustment', 'YawningConsecutiveAdjustment',
+                         'CombinedConsecutiveAdjustment', 'AttentionConsecutiveAdjustment', 'ExtremeValueAdjustment')
+
+
+def edge_gesture_windows(window=WINDOW):
+    """Ventanas constantes y de dos bloques (a...ab...b) con el corte alrededor de los umbrales de las capas"""
+    splits = sorted({s for t in (4, 5, 7, 10, 40, 100, 160) for s in (t - 1, t, t + 1)} | {1, window // 2})
+    windows = [np.full(window, code, dtype=np.uint8) for code in (ATTENTION, EYESCLOSED, YAWNING)]
+    for first in (ATTENTION, EYESCLOSED, YAWNING):
+        for second in (ATTENTION, EYESCLOSED, YAWNING):
+            if first == second:
+                continue
+            for split in splits:
+                # El corte se prueba por ambos lados: racha inicial y racha final de `split` gestos
+                for head in (split, window - split):
+                    windows.append(np.r_[np.full(head, first), np.full(window - head, second)].astype(np.uint8))
+    return np.asarray(windows)
+
+
+def model_index(model, windows):
+    outputs, _ = model.predict(np.asarray(windows, dtype=np.float32).reshape((-1, WINDOW, 1)), verbose=0)
+    return outputs[:, 0]
+
+
+@pytest.fixture(scope="module")
+def reference_model(index_model_path):
+    """El mismo modelo cargado con las capas anteriores a la vectorización (tf.map_fn)"""
+    tf = pytest.importorskip("tensorflow")
+    from reference_layers import REFERENCE_OBJECTS
+
+    return tf.keras.models.load_model(index_model_path, custom_objects=REFERENCE_OBJECTS, compile=False)
+
+
+def test_layers_match_map_fn_reference(index_model, reference_model):
+    import tensorflow as tf
+
+    model, _ = index_model
+    windows = np.concatenate((random_gesture_windows(1000), edge_gesture_windows()))
+    X = tf.constant(windows.reshape((-1, WINDOW, 1)), dtype=tf.float32)
+    # En grafo: tf.map_fn en modo eager tarda minutos con mil ventanas
+    run = tf.function(lambda layer, inputs: layer(inputs))
+    layers = [layer for layer in reference_model.layers if type(layer).__name__ in REFERENCE_LAYER_NAMES]
+    assert type(layers[0]).__name__ == 'DrowsinessIndexLayer'
+
+    previous = run(layers[0], X)
+    np.testing.assert_allclose(run(model.get_layer(layers[0].name), X), previous, atol=TOLERANCE, rtol=0,
+                               err_msg=layers[0].name)
+    # Cada ajuste recibe el índice de la capa anterior de la referencia y, aparte, uno uniforme en [0, 1]
+    uniform = tf.constant(np.random.default_rng(0).uniform(0, 1, size=previous.shape), dtype=tf.float32)
+    for reference in layers[1:]:
+        vectorized = model.get_layer(reference.name)
+        for index in (previous, uniform):
+            np.testing.assert_allclose(run(vectorized, [index, X]), run(reference, [index, X]),
+                                       atol=TOLERANCE, rtol=0, err_msg=reference.name)
+        previous = run(reference, [previous, X])
+    np.testing.assert_allclose(model_index(model, windows), model_index(reference_model, windows),
+                               atol=TOLERANCE, rtol=0)
+
+
+def test_streaming_evaluator_matches_model(index_model):
+    model, params = index_model
+    steps = 60
+    windows = random_gesture_windows(500)
+    tails = random_gesture_windows(500, window=steps, seed=1)
+    expected, streamed = [], []
+    for window, tail in zip(windows, tails):
+        # Se carga la ventana y luego se deslizan `steps` gestos, para ejercitar también la salida de los antiguos
+        evaluator = StreamingDrowsinessEvaluator(params, initial=window)
+        streamed.append(evaluator.index())
+        for code in tail:
+            evaluator.push(code)
+        streamed.append(evaluator.index())
+        expected.extend([window, np.concatenate((window, tail))[-WINDOW:]])
+    np.testing.assert_allclose(streamed, model_index(model, expected), atol=TOLERANCE, rtol=0)
+
+
+def test_numpy_engine_matches_model(index_model):
+    model, params = index_model
+    windows = np.concatenate((random_gesture_windows(2000), edge_gesture_windows()))
+    np.testing.assert_allclose(NumpyDrowsinessModel(params).predict(windows), model_index(model, windows),
+                               atol=TOLERANCE, rtol=0)
+
+
+def test_score_sequence_matches_materialized_windows(index_model):
+    _, params = index_model
+    engine = NumpyDrowsinessModel(params)
+    codes = random_gesture_windows(1, window=20000)[0]
+    padded = np.concatenate((np.full(WINDOW - 1, ATTENTION, dtype=np.uint8), codes))
+    reference = engine.predict(np.lib.stride_tricks.sliding_window_view(padded, WINDOW))
+    # Bloques que no dividen la secuencia, para cruzar los bordes entre bloques
+    np.testing.assert_array_equal(engine.score_sequence(codes, initial=ATTENTION, chunk_size=3000), reference)
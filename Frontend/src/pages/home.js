@@ -9,7 +9,7 @@ import DialogContent from '@mui/material/DialogContent';
 import DialogContentText from '@mui/material/DialogContentText';
 import DialogTitle from '@mui/material/DialogTitle';
 import Button from '@mui/material/Button';
-import { processImage } from '../services/apiService';
+import { processImage, openImageStream } from '../services/apiService';
 import './Home.css';
 import alarm1 from '../assets/audio/alarm1.mp3';
 import alarm2 from '../assets/audio/alarm2.mp3';
@@ -90,6 +90,7 @@ function Home() {
   const audioRef = useRef(null);
   const streamRef = useRef(null);
   const capturingRef = useRef(false);
+  const imageStreamRef = useRef(null);
 
   useEffect(() => {
     const savedAvatar = localStorage.getItem('selectedAvatar');
@@ -202,6 +203,10 @@ function Home() {
       streamRef.current.getTracks().forEach(track => track.stop());
       streamRef.current = null;
     }
+    if (imageStreamRef.current) {
+      imageStreamRef.current.close();
+      imageStreamRef.current = null;
+    }
   }, []);
 
 
@@ -234,6 +239,23 @@ function Home() {
       canvas.height = 112;
       const context = canvas.getContext('2d');
 
+      const handleResult = (data) => {
+        // El backend descartó el frame porque llegó uno más reciente: no hay nada que mostrar
+        if (data.dropped) return;
+        if (data.error) {
+          console.error("Error al procesar la imagen:", data.error);
+          return;
+        }
+        // Postprocesamiento del gesto
+        // Actualiza el confidence directamente, sin filtro
+        console.log("Gesto detectado:", data.gesture_name);
+        setPercent(data.confidence * 100);
+        postprocessGesture(data.gesture);
+      };
+
+      // Conexión persistente con el backend; si no está disponible se usa POST por frame
+      imageStreamRef.current = await openImageStream(handleResult);
+
       // Captura imágenes a 1 FPS
       const captureFrame = () => {
         if (!capturingRef.current) return;
@@ -267,12 +289,12 @@ function Home() {
         canvas.toBlob(async (blob) => {
           if (blob) {
             try {
+              if (imageStreamRef.current && imageStreamRef.current.isOpen()) {
+                imageStreamRef.current.send(blob);
+                return;
+              }
               const data = await processImage(blob);
-              // Postprocesamiento del gesto
-              // Actualiza el confidence directamente, sin filtro
-              console.log("Gesto detectado:", data.gesture_name);
-              setPercent(data.confidence * 100);
-              postprocessGesture(data.gesture);
+              handleResult(data);
 
               // El resto de tus actualizaciones de estado van aquí,
               // pero el gesto mostrado será el filtrado por el historial
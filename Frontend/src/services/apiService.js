@@ -20,6 +20,8 @@ export const processImage = async (imageBlob) => {
 
     if (!response.ok) {
       const errorData = await response.json();
+      // 429: el backend descartó este frame en favor de uno más reciente de la sesión
+      if (response.status === 429 && errorData.dropped) return errorData;
       throw new Error(errorData.error || 'Error al procesar la imagen');
     }
 
@@ -28,4 +30,43 @@ export const processImage = async (imageBlob) => {
     console.error('Error en la API:', error.message);
     throw error; // Lanza el error para que el frontend lo maneje
   }
-};
\ No newline at end of file
+};
+
+const WS_BASE_URL = API_BASE_URL.replace(/^http/, 'ws');
+
+// Clave de enrutamiento de la sesión: los 12 primeros hex del SHA-1 del token, como los
+// nombres de archivo del backend. Va en la URL, que queda en los logs; el token no.
+const sessionRoutingKey = async (token) => {
+  if (!token) return '';
+  const digest = await crypto.subtle.digest('SHA-1', new TextEncoder().encode(token));
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('').slice(0, 12);
+};
+
+// Abre una conexión persistente con /stream: los frames se envían como binario y
+// onResult recibe la respuesta de cada uno (mismo formato que /process-image)
+export const openImageStream = async (onResult, onClose) => {
+  // La clave de sesión va en la URL para que el balanceador envíe la sesión siempre al mismo worker
+  const token = localStorage.getItem('token');
+  const session = await sessionRoutingKey(token);
+  const socket = new WebSocket(`${WS_BASE_URL}/stream?session=${session}`);
+
+  socket.onopen = () => {
+    // El navegador no permite el header Authorization en un WebSocket
+    socket.send(JSON.stringify({ token }));
+  };
+  socket.onmessage = (event) => {
+    try {
+      onResult(JSON.parse(event.data));
+    } catch (error) {
+      console.error('Respuesta no válida del stream:', error.message);
+    }
+  };
+  socket.onerror = () => console.error('Error en la conexión de streaming');
+  socket.onclose = () => onClose && onClose();
+
+  return {
+    isOpen: () => socket.readyState === WebSocket.OPEN,
+    send: (blob) => socket.send(blob),
+    close: () => socket.close(),
+  };
+};